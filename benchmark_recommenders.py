@@ -0,0 +1,49 @@
+# benchmark_recommenders.py
+# Throughput benchmark of the recommenders, runnable offline against a local store:
+#   STORAGE_BACKEND=sqlite python upload_to_firebase.py      (seed local_store.db from clean_data.csv)
+#   STORAGE_BACKEND=sqlite python benchmark_recommenders.py
+import time
+import numpy as np
+
+from preprocess_data import process_data
+from rating_based_recommendation import get_top_rated_items
+from content_based_filtering import content_based_recommendation
+from collaborative_based_filtering import collaborative_filtering_recommendations
+from item_based_collaborative_filtering import item_based_collaborative_filtering
+from hybrid_approach import hybrid_recommendation_filtering
+from firebase_utils import initialize_firebase_app, fetch_products_from_firebase
+
+def benchmark(name, func, args_list):
+    """Runs func over args_list and prints latency percentiles and throughput."""
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    print(f"{name:<28} n={len(timings):<5} p50={np.percentile(timings, 50):8.2f} ms  "
+          f"p95={np.percentile(timings, 95):8.2f} ms  {len(timings) / timings.sum() * 1000:9.1f} calls/s")
+
+if __name__ == "__main__":
+    initialize_firebase_app()
+
+    start = time.perf_counter()
+    raw_data = fetch_products_from_firebase()
+    if raw_data is None:
+        print("Failed to load data")
+        exit()
+    data = process_data(raw_data)
+    print(f"Loaded and processed {len(data)} rows in {time.perf_counter() - start:.2f}s")
+
+    rng = np.random.default_rng(42)
+    n_calls = 200
+    user_ids = rng.choice(data['ID'].unique(), n_calls)
+    prod_ids = rng.choice(data['ProdID'].unique(), n_calls)
+    names = rng.choice(data['Name'].unique(), n_calls)
+
+    # First calls include building the per-catalog models, later calls reuse them
+    benchmark("top rated", get_top_rated_items, [(data, 10)] * n_calls)
+    benchmark("content based", content_based_recommendation, [(data, n, 10) for n in names])
+    benchmark("user collaborative", collaborative_filtering_recommendations, [(data, u, 10) for u in user_ids])
+    benchmark("item collaborative", item_based_collaborative_filtering, [(data, p, 5) for p in prod_ids])
+    benchmark("hybrid", hybrid_recommendation_filtering, [(data, n, u, 10) for n, u in zip(names, user_ids)])
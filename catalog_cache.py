@@ -0,0 +1,177 @@
+"""
+Process-wide cache for structures derived from the catalog DataFrame
+(interaction matrices, similarity indexes, fitted models).
+
+Derived structures are keyed by a fingerprint of the columns they are built from,
+so they are rebuilt only when the data returned by get_data_from_firebase changes.
+The catalog DataFrame is treated as read-only: fingerprints are memoized per
+DataFrame object, so hashing happens once per loaded catalog, not once per call.
+
+cached_build keeps the structures in a small LRU. Structures that are updated in place
+after the build (new ratings) use pinned_build instead, which keeps them for as long as
+a catalog of their version is loaded, so an eviction can never drop those updates.
+"""
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# id(DataFrame) -> (weakref to it, {columns: version})
+_versions = {}
+_versions_lock = threading.RLock()
+
+
+def _fingerprint(data: pd.DataFrame, columns) -> str:
+    digest = hashlib.blake2b(digest_size=12)
+    for col in columns:
+        if col not in data.columns:
+            continue
+        values = data[col]
+        digest.update(str(col).encode())
+        if pd.api.types.is_numeric_dtype(values.dtype) and not isinstance(values.dtype, pd.CategoricalDtype):
+            # Raw bytes of numeric columns hash at memory speed
+            digest.update(np.ascontiguousarray(values.to_numpy()).tobytes())
+        else:
+            digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes())
+    return f"{len(data)}-{digest.hexdigest()}"
+
+
+def catalog_version(data: pd.DataFrame, columns) -> str:
+    """
+    Returns a fingerprint of the given columns of the catalog DataFrame.
+    The fingerprint changes whenever the data returned by get_data_from_firebase changes.
+    """
+    if not isinstance(data, pd.DataFrame):
+        # A NormalizedCatalog (preprocess_data) carries its own version
+        return data.version
+    key = tuple(columns)
+    with _versions_lock:
+        entry = _versions.get(id(data))
+        if entry is not None and entry[0]() is data and key in entry[1]:
+            return entry[1][key]
+
+    version = _fingerprint(data, columns)
+
+    with _versions_lock:
+        entry = _versions.get(id(data))
+        if entry is None or entry[0]() is not data:
+            data_id = id(data)
+            def forget(ref):
+                with _versions_lock:
+                    if _versions.get(data_id, (None,))[0] is ref:
+                        del _versions[data_id]
+            entry = (weakref.ref(data, forget), {})
+            _versions[data_id] = entry
+        entry[1][key] = version
+    return version
+
+
+class VersionedCache:
+    """Small thread-safe LRU cache of objects built from a catalog version."""
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> lock held while that key is being built
+        self._building = {}
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return True, self._items[key]
+            return False, None
+
+    def get_or_build(self, key, builder):
+        found, value = self._lookup(key)
+        if found:
+            return value
+        # Build outside the cache lock so a slow build does not block unrelated lookups,
+        # but only once per key: concurrent callers wait for the first build and share it
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            found, value = self._lookup(key)
+            if found:
+                return value
+            try:
+                value = builder()
+                with self._lock:
+                    self._items[key] = value
+                    self._items.move_to_end(key)
+                    while len(self._items) > self.maxsize:
+                        self._items.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._building.pop(key, None)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+# Room for every structure derived from a couple of catalog versions
+_cache = VersionedCache(maxsize=32)
+
+
+class _Pinned:
+    """A structure built by pinned_build and the catalogs (ids) of its version still loaded."""
+
+    def __init__(self):
+        self.holders = set()
+        self.build_lock = threading.Lock()
+        self.built = False
+        self.value = None
+
+
+# (name, version) -> _Pinned
+_pinned = {}
+_pinned_lock = threading.Lock()
+
+
+def cached_build(name, data, columns, builder):
+    """
+    Builds `builder(data)` once per catalog version and reuses it afterwards.
+    `name` separates different derived structures built from the same data.
+    """
+    key = (name, catalog_version(data, columns))
+    return _cache.get_or_build(key, lambda: builder(data))
+
+
+def pinned_build(name, data, columns, builder):
+    """
+    cached_build for structures updated in place after the build. They are kept outside
+    the LRU and released once no catalog object of their version is alive any more.
+    """
+    key = (name, catalog_version(data, columns))
+    with _pinned_lock:
+        entry = _pinned.setdefault(key, _Pinned())
+        if id(data) not in entry.holders:
+            entry.holders.add(id(data))
+            weakref.finalize(data, _unpin, key, id(data))
+    with entry.build_lock:
+        if not entry.built:
+            entry.value = builder(data)
+            entry.built = True
+    return entry.value
+
+
+def _unpin(key, data_id):
+    with _pinned_lock:
+        entry = _pinned.get(key)
+        if entry is not None:
+            entry.holders.discard(data_id)
+            if not entry.holders:
+                del _pinned[key]
+
+
+def clear_catalog_cache():
+    """Drops every cached derived structure (e.g. after a forced data refresh)."""
+    _cache.clear()
+    with _pinned_lock:
+        _pinned.clear()
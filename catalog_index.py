@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from catalog_cache import cached_build
+
+# Product-level columns the recommenders return (Rating is the first rating seen for the product,
+# as with the drop_duplicates(subset=['ProdID']) calls this index replaces)
+PRODUCT_COLUMNS = ('ProdID', 'Name', 'Brand', 'Category', 'ImageURL', 'Rating', 'ReviewCount', 'Tags')
+
+
+class CatalogIndex:
+    """
+    Deduplicated product-detail table (one row per ProdID) with O(1) lookups:
+    Name -> row position and ProdID -> row position.
+    """
+
+    def __init__(self, products):
+        self.products = products.reset_index(drop=True)
+        self.product_ids = self.products['ProdID'].to_numpy()
+        self.product_index = pd.Index(self.product_ids)
+        names = self.products['Name']
+        first_name = ~names.duplicated()
+        self.name_positions = dict(zip(names[first_name], np.flatnonzero(first_name)))
+
+    def __len__(self):
+        return len(self.products)
+
+    def position_of_name(self, name):
+        """Row position of the first product called `name`, or None."""
+        return self.name_positions.get(name)
+
+    def position_of_product(self, product_id):
+        """Row position of `product_id`, or None."""
+        try:
+            return self.product_index.get_loc(product_id)
+        except (KeyError, TypeError):
+            return None
+
+    def positions(self, product_ids):
+        """Row positions of many ProdIDs at once (-1 where a ProdID is unknown)."""
+        return self.product_index.get_indexer(np.asarray(product_ids))
+
+    def take(self, product_ids, columns=None, return_mask=False):
+        """
+        Product rows for `product_ids`, in the given order; unknown ProdIDs are skipped.
+        With return_mask=True also returns the boolean mask of the ProdIDs that were kept,
+        to align per-ID arrays (e.g. scores) with the rows.
+        """
+        positions = self.positions(product_ids)
+        kept = positions >= 0
+        rows = self.products.take(positions[kept])
+        rows = rows if columns is None else rows[list(columns)]
+        return (rows, kept) if return_mask else rows
+
+
+def build_catalog_index(data) -> CatalogIndex:
+    if not isinstance(data, pd.DataFrame):
+        # NormalizedCatalog: the products table already has one row per ProdID
+        return CatalogIndex(data.products)
+    columns = [c for c in PRODUCT_COLUMNS if c in data.columns]
+    products = data.drop_duplicates(subset=['ProdID'])[columns]
+    return CatalogIndex(products)
+
+
+def get_catalog_index(data) -> CatalogIndex:
+    """Returns the catalog index, rebuilt only when the product details change."""
+    return cached_build('catalog_index', data, PRODUCT_COLUMNS, build_catalog_index)
@@ -0,0 +1,118 @@
+"""
+Local columnar snapshot of the processed catalog.
+
+The processed catalog is written to a Parquet file stamped with the catalog version
+published at CATALOG_VERSION_PATH in the Realtime Database. At startup the app only
+reads that small version node: when it matches the snapshot, the catalog is loaded
+from disk (memory-mapped) instead of downloading the whole /products node.
+
+Without a published version the snapshot cannot be validated, so it is only trusted for
+UNVERSIONED_TTL seconds after it was written. When the database cannot be reached the
+local copy is served as a fallback for that call only; the next call checks again.
+"""
+import os
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEFAULT_SNAPSHOT_PATH = 'catalog_snapshot.parquet'
+# Realtime Database node holding the version of /products; bumped by every writer
+CATALOG_VERSION_PATH = '/meta/products_version'
+_VERSION_KEY = b'catalog_version'
+# Seconds a catalog is reused when no version is published to validate it against
+UNVERSIONED_TTL = 600
+
+# Catalog currently loaded in this process: (version, DataFrame, time it was written)
+_loaded = (None, None, 0.0)
+_loaded_lock = threading.Lock()
+
+
+def new_catalog_version() -> str:
+    """Version stamp to publish at CATALOG_VERSION_PATH after changing /products."""
+    return str(time.time_ns())
+
+
+def write_snapshot(data, version, path=DEFAULT_SNAPSHOT_PATH):
+    """Writes the processed catalog with its version stamp (atomically replaces the file)."""
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_VERSION_KEY] = str(version).encode()
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot_version(path=DEFAULT_SNAPSHOT_PATH):
+    """Version stamp of the snapshot (reads only the file footer), or None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    version = metadata.get(_VERSION_KEY)
+    return version.decode() if version is not None else None
+
+
+def read_snapshot(path=DEFAULT_SNAPSHOT_PATH):
+    """Loads the processed catalog from the snapshot (dtypes are restored from the file)."""
+    return pq.read_table(path, memory_map=True).to_pandas()
+
+
+def _is_current(version, written_at, remote_version):
+    """Whether a copy stamped `version` and written at `written_at` can be served as is."""
+    if remote_version is not None:
+        return str(remote_version) == version
+    return time.time() - written_at < UNVERSIONED_TTL
+
+
+def load_catalog(fetch_remote_version, fetch_catalog, process, path=DEFAULT_SNAPSHOT_PATH):
+    """
+    Returns the processed catalog, downloading it only when the remote version changed.
+
+    fetch_remote_version() -> published version, or None if no version was ever published;
+                              raises when the database cannot be reached
+    fetch_catalog()        -> raw catalog DataFrame or None
+    process(raw)           -> processed catalog DataFrame
+
+    The same DataFrame object is returned while the version is unchanged, so models
+    cached per catalog (see catalog_cache) stay valid.
+    """
+    global _loaded
+    try:
+        remote_version = fetch_remote_version()
+        online = True
+    except Exception as e:
+        print(f"Catalog version unavailable ({e}); serving the local copy")
+        remote_version, online = None, False
+
+    with _loaded_lock:
+        loaded_version, loaded_data, loaded_at = _loaded
+        if online and loaded_data is not None and _is_current(loaded_version, loaded_at, remote_version):
+            return loaded_data
+
+        snapshot_version = read_snapshot_version(path)
+        snapshot_written_at = os.path.getmtime(path) if snapshot_version is not None else 0.0
+        if online and snapshot_version is not None and _is_current(snapshot_version, snapshot_written_at, remote_version):
+            data = read_snapshot(path)
+            _loaded = (snapshot_version, data, snapshot_written_at)
+            return data
+
+        raw_data = fetch_catalog() if online else None
+        if raw_data is None or raw_data.empty:
+            # Serve the stale copy rather than nothing; it is checked again on the next call
+            if loaded_data is not None:
+                return loaded_data
+            if snapshot_version is not None:
+                data = read_snapshot(path)
+                _loaded = (snapshot_version, data, snapshot_written_at)
+                return data
+            return None
+
+        data = process(raw_data)
+        version = str(remote_version) if remote_version is not None else new_catalog_version()
+        write_snapshot(data, version, path)
+        _loaded = (version, data, time.time())
+        return data
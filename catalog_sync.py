@@ -0,0 +1,150 @@
+"""
+Incremental sync of the /products node.
+
+Every writer stamps the records it changes with UPDATED_AT and marks removed records with
+DELETED instead of dropping them. The stamp is the server's clock ({'.sv': 'timestamp'},
+milliseconds since epoch), so a writer whose own clock runs behind cannot stamp a change
+older than what readers already synced. CatalogSync downloads the whole node once, then
+only the records stamped since the last sync, re-reading an overlap window:
+
+    ref.order_by_child('updated_at').start_at(last_synced - SYNC_OVERLAP_MS).get()
+
+The overlap catches writes that committed after a sync but carry a slightly older stamp
+(concurrent writers); records re-read unchanged are skipped.
+
+Ratings given in the app are kept under /ratings (one record per user and product), not
+/products, so they don't change the catalog or the artifacts built from it; they sync the
+same way with CatalogSync(database, RATINGS_PATH).
+
+The Realtime Database needs an index for that query; add to the database rules:
+    {"rules": {"products": {".indexOn": ["updated_at"]}, "ratings": {".indexOn": ["updated_at"]}}}
+
+`database` is anything with reference(path) like firebase_admin.db, e.g. memory_db.InMemoryDatabase.
+"""
+import threading
+import time
+
+import pandas as pd
+
+from catalog_snapshot import CATALOG_VERSION_PATH, new_catalog_version
+
+PRODUCTS_PATH = '/products'
+# Number of index keys written by the last full upload; keys beyond it are tombstoned
+PRODUCTS_COUNT_PATH = '/meta/products_count'
+# {rating_key(user, product): {ID, ProdID, Rating, updated_at}} written by the app
+RATINGS_PATH = '/ratings'
+UPDATED_AT = 'updated_at'
+DELETED = 'deleted'
+# Resolved by the database to its own time (milliseconds) when the write is applied
+SERVER_TIMESTAMP = {'.sv': 'timestamp'}
+# Milliseconds before the last synced stamp that every pull reads again
+SYNC_OVERLAP_MS = 60_000
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def stamp_records(records, timestamp=None):
+    """Adds the UPDATED_AT stamp (the server's time unless `timestamp` is given) to every record, in place."""
+    for record in records:
+        record[UPDATED_AT] = dict(SERVER_TIMESTAMP) if timestamp is None else timestamp
+    return records
+
+
+def rating_key(user_id, product_id):
+    return f"{user_id}_{product_id}"
+
+
+def write_product_changes(database, changes, path=PRODUCTS_PATH):
+    """
+    Writes changed records in one multi-path update and publishes a new catalog version.
+    changes: {record key: record dict, or None to delete the record}
+    """
+    update = {}
+    for key, record in changes.items():
+        if record is None:
+            # Keep a tombstone so incremental readers learn about the deletion
+            update[str(key)] = {DELETED: True, UPDATED_AT: dict(SERVER_TIMESTAMP)}
+        else:
+            update[str(key)] = dict(record, **{UPDATED_AT: dict(SERVER_TIMESTAMP)})
+    if update:
+        database.reference(path).update(update)
+        database.reference(CATALOG_VERSION_PATH).set(new_catalog_version())
+    return len(update)
+
+
+def _as_items(node):
+    """Firebase returns list-shaped nodes as lists and the rest as dicts."""
+    if isinstance(node, list):
+        return [(str(i), record) for i, record in enumerate(node) if record is not None]
+    if isinstance(node, dict):
+        return [(str(k), record) for k, record in node.items() if record is not None]
+    return []
+
+
+def _key_order(key):
+    return (0, int(key), '') if key.isdigit() else (1, 0, key)
+
+
+class CatalogSync:
+    """Keeps an in-memory copy of /products in step with the database."""
+
+    def __init__(self, database, path=PRODUCTS_PATH, overlap_ms=SYNC_OVERLAP_MS):
+        self.database = database
+        self.path = path
+        self.overlap_ms = overlap_ms
+        self.records = {}
+        self.last_synced = None
+        self._lock = threading.Lock()
+
+    def full_load(self):
+        """Downloads the whole node. Returns the number of records."""
+        node = self.database.reference(self.path).get()
+        self.records = {}
+        self.last_synced = 0
+        for key, record in _as_items(node):
+            self._apply(key, record)
+        return len(self.records)
+
+    def pull_changes(self):
+        """Fetches and applies only the records changed since the last sync. Returns the number applied."""
+        query = self.database.reference(self.path).order_by_child(UPDATED_AT).start_at(self.last_synced - self.overlap_ms)
+        applied = 0
+        for key, record in _as_items(query.get()):
+            if self._is_known(key, record):
+                continue
+            self._apply(key, record)
+            applied += 1
+        return applied
+
+    def _is_known(self, key, record):
+        """True if the record was already applied (re-read inside the overlap window)."""
+        if isinstance(record, dict) and record.get(DELETED):
+            return key not in self.records
+        return self.records.get(key) == record
+
+    def _apply(self, key, record):
+        stamp = record.get(UPDATED_AT) if isinstance(record, dict) else None
+        if stamp is not None:
+            self.last_synced = max(self.last_synced, stamp)
+        if not isinstance(record, dict) or record.get(DELETED):
+            self.records.pop(key, None)
+        else:
+            self.records[key] = record
+
+    def fetch(self):
+        """Returns the current raw catalog as a DataFrame, downloading only what changed."""
+        with self._lock:
+            if self.last_synced is None:
+                self.full_load()
+            else:
+                self.pull_changes()
+            return self.to_frame()
+
+    def to_frame(self):
+        if not self.records:
+            return None
+        keys = sorted(self.records, key=_key_order)
+        frame = pd.DataFrame([self.records[k] for k in keys])
+        return frame.drop(columns=[UPDATED_AT, DELETED], errors='ignore')
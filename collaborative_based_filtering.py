@@ -1,27 +1,139 @@
 import pandas as pd
+import numpy as np
 import sklearn
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
 
-def collaborative_filtering_recommendations(data, target_user_id, top_n = 10):
-  user_item_matrix = data.pivot_table(index= 'ID', columns='ProdID', values='Rating', aggfunc= 'mean').fillna(0)
+from interaction_matrix import get_interaction_matrix
+from catalog_index import get_catalog_index
+from ranking import top_n_indices, top_n_indices_2d
+from user_neighbor_index import get_user_neighbor_index
+
+# Number of most similar users whose ratings are aggregated into the scores
+DEFAULT_K_NEIGHBORS = 50
+# Users scored together by the batch API; memory per block is about
+# block_size * (users + products) * 8 bytes
+DEFAULT_BLOCK_SIZE = 256
+# From this many users on, collaborative_filtering_recommendations searches neighbours
+# in the approximate user index (user_neighbor_index) instead of scanning every user
+APPROXIMATE_MIN_USERS = 200_000
+
+def top_k_similar_users(interactions, target_user_index, k=None, neighbor_index=None):
+  """
+  Returns (user codes, cosine similarities) of the users most similar to the target, best first.
+  Only the target's similarity row is computed (one sparse row x matrix product), so the
+  cost is linear in the number of ratings instead of quadratic in the number of users.
+  k caps the number of neighbours; None keeps every other user.
+  With a UserNeighborIndex only the users it returns as candidates are compared.
+  """
+  if neighbor_index is not None:
+      return neighbor_index.top_k_similar_users(target_user_index, k)
+
+  # Every user's current ratings, those set since the build included
+  similarities = interactions.cosine_similarities(interactions.normalized_row(target_user_index)).ravel()
+  similarities[target_user_index] = -np.inf
+
+  n_candidates = len(similarities) - 1
+  neighbours = top_n_indices(similarities, n_candidates if k is None else min(k, n_candidates))
+  return neighbours, similarities[neighbours]
+
+def score_items_for_user(interactions, target_user_index, k_neighbors = DEFAULT_K_NEIGHBORS, neighbor_index = None):
+  """
+  Scores every product for the target user as the similarity-weighted mean rating of
+  the k nearest neighbours who rated it (two sparse matrix products: weighted ratings and
+  the similarity mass of the raters). Products the user already rated, or that no
+  neighbour rated, get -inf.
+  """
+  neighbours, similarities = top_k_similar_users(interactions, target_user_index, k_neighbors, neighbor_index)
+  positive = similarities > 0
+  neighbours, similarities = neighbours[positive], similarities[positive]
+
+  scores = np.full(interactions.shape[1], -np.inf, dtype=np.float32)
+  if len(neighbours) == 0:
+      return scores
+
+  neighbour_ratings = interactions.user_rows(neighbours)
+  weighted = neighbour_ratings.T @ similarities
+  # Divide by the similarity of the neighbours who rated each product, not of all neighbours
+  rater_similarity = (neighbour_ratings != 0).astype(np.float64).T @ similarities
+  rated_by_neighbours = rater_similarity > 0
+  scores[rated_by_neighbours] = weighted[rated_by_neighbours] / rater_similarity[rated_by_neighbours]
+  scores[interactions.rated_items(target_user_index)] = -np.inf
+  return scores
+
+def collaborative_filtering_recommendations(data, target_user_id, top_n = 10, k_neighbors = DEFAULT_K_NEIGHBORS, approximate = None):
+  """
+  Returns up to top_n products the target user has not rated, ranked by the
+  similarity-weighted ratings of similar users (one row per product, with a Score column).
+  approximate: find the neighbours with the LSH user index; None decides by APPROXIMATE_MIN_USERS.
+  """
+  interactions = get_interaction_matrix(data)
+  target_user_index = interactions.user_code(target_user_id)
   
-  if target_user_id not in user_item_matrix.index:
+  if target_user_index is None:
       return pd.DataFrame()
-      
-  user_similarity = cosine_similarity(user_item_matrix)
-  target_user_index = user_item_matrix.index.get_loc(target_user_id)
-  user_similarities = user_similarity[target_user_index]
-  similar_users_indices = user_similarities.argsort()[::-1][1:]
-  recommended_items = []
 
-  for user_index in similar_users_indices:
-    rated_by_similar_user = user_item_matrix.iloc[user_index]
-    not_rated_by_target_user = (rated_by_similar_user!=0) & (user_item_matrix.iloc[target_user_index]==0)
+  if approximate is None:
+      approximate = interactions.shape[0] >= APPROXIMATE_MIN_USERS
+  neighbor_index = get_user_neighbor_index(data) if approximate else None
+  scores = score_items_for_user(interactions, target_user_index, k_neighbors, neighbor_index)
+  top_items = top_n_indices(scores, top_n)
+  recommended_items = interactions.item_ids[top_items]
+
+  recommended_items_details, kept = get_catalog_index(data).take(recommended_items, ['ProdID', 'Name', 'ImageURL', 'Brand', 'Rating', 'ReviewCount'], return_mask=True)
+  return recommended_items_details.assign(Score=scores[top_items][kept])
+
+
+def score_items_for_users(interactions, target_user_indices, k_neighbors = DEFAULT_K_NEIGHBORS):
+  """
+  score_items_for_user for a block of users at once (rows x products, float32):
+  one sparse product for the similarity block, one for the neighbour-weighted ratings.
+  """
+  target_user_indices = np.asarray(target_user_indices)
+  n_rows, n_users = len(target_user_indices), interactions.shape[0]
+  scores = np.full((n_rows, interactions.shape[1]), -np.inf, dtype=np.float32)
+  k = min(k_neighbors, n_users - 1)
+  if n_rows == 0 or k <= 0:
+      return scores
+
+  similarities = np.ascontiguousarray(interactions.cosine_similarities(interactions.normalized_rows(target_user_indices)).T)
+  similarities[np.arange(n_rows), target_user_indices] = -np.inf
+
+  # k nearest neighbours per row (ties to the lowest user code, as in top_k_similar_users);
+  # only positive similarities contribute
+  neighbours, weights = top_n_indices_2d(similarities, k)
+  neighbours = np.maximum(neighbours, 0)
+  weights[~(weights > 0)] = 0
+  weight_matrix = sparse.csr_matrix((weights.ravel(), neighbours.ravel(), np.arange(0, n_rows * k + 1, k)),
+                                    shape=(n_rows, n_users))
+  weighted = interactions.weighted_ratings(weight_matrix)
+  rater_similarity = interactions.weighted_ratings(weight_matrix, binary=True)
+  rated_by_neighbours = rater_similarity > 0
+  scores[rated_by_neighbours] = weighted[rated_by_neighbours] / rater_similarity[rated_by_neighbours]
+  rows, items = interactions.user_rows(target_user_indices).nonzero()
+  scores[rows, items] = -np.inf
+  return scores
 
-    recommended_items.extend(user_item_matrix.columns[not_rated_by_target_user][:top_n])
-  recommended_items_details = data[data['ProdID'].isin(recommended_items)][['ProdID', 'Name', 'ImageURL', 'Brand', 'Rating', 'ReviewCount']]
-  return recommended_items_details
+def batch_collaborative_filtering_recommendations(data, target_user_ids, top_n = 10, k_neighbors = DEFAULT_K_NEIGHBORS, block_size = DEFAULT_BLOCK_SIZE):
+  """
+  Top-N recommendations for many users at once (e.g. to precompute them for every user).
+  Users are scored in blocks of `block_size`, which bounds memory.
+  Returns (product_ids, scores), both len(target_user_ids) x top_n, best first;
+  empty slots (and unknown users) hold ProdID -1 and score -inf.
+  """
+  interactions = get_interaction_matrix(data)
+  user_codes = interactions.user_index.get_indexer(np.asarray(target_user_ids))
+  product_ids = np.full((len(user_codes), top_n), -1, dtype=np.int64)
+  scores = np.full((len(user_codes), top_n), -np.inf, dtype=np.float32)
 
+  known = np.flatnonzero(user_codes >= 0)
+  for start in range(0, len(known), block_size):
+      rows = known[start:start + block_size]
+      block_scores = score_items_for_users(interactions, user_codes[rows], k_neighbors)
+      top_items, top_scores = top_n_indices_2d(block_scores, top_n)
+      width = top_items.shape[1]
+      product_ids[rows, :width] = np.where(top_items >= 0, interactions.item_ids[top_items], -1)
+      scores[rows, :width] = top_scores
+  return product_ids, scores
 
 #Example usage
 if __name__ == "__main__":
@@ -1,27 +1,107 @@
+import os
 import pandas as pd
 import numpy as np
 import sklearn
+import joblib
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from catalog_cache import cached_build, catalog_version
+from catalog_index import get_catalog_index
+from ranking import top_n_indices
+
+CONTENT_COLUMNS = ('ProdID', 'Tags')
+DEFAULT_CONTENT_MODEL_PATH = 'content_model.joblib'
+
+class ContentModel:
+    """
+    TF-IDF model over the product Tags, fitted once per catalog version.
+    Holds one row per ProdID; similarity is computed only for the query row.
+    """
+    def __init__(self, item_ids, vectorizer, tfidf_matrix, version=''):
+        self.item_ids = np.asarray(item_ids)
+        self.item_index = pd.Index(self.item_ids)
+        self.vectorizer = vectorizer
+        self.tfidf_matrix = tfidf_matrix
+        self.version = version
+
+    @classmethod
+    def fit(cls, data, version=''):
+        products = get_catalog_index(data).products
+        tfidf_vectorizer = TfidfVectorizer(stop_words='english')
+        # Rows are L2-normalized, so a dot product is the cosine similarity
+        tfidf_matrix = tfidf_vectorizer.fit_transform(products['Tags'])
+        return cls(products['ProdID'].to_numpy(), tfidf_vectorizer, tfidf_matrix.astype(np.float32), version)
+
+    def position_of_product(self, product_id):
+        try:
+            return self.item_index.get_loc(product_id)
+        except (KeyError, TypeError):
+            return None
+
+    def similar_items(self, item_position, top_n=10):
+        """Returns (product positions, similarities) of the items closest to the given product."""
+        similarities = (self.tfidf_matrix @ self.tfidf_matrix[item_position].T).toarray().ravel()
+        positions = top_n_indices(similarities, top_n)
+        return positions, similarities[positions]
+
+    def search(self, query, top_n=10):
+        """
+        Returns (product positions, similarities) of the products whose tags best match a
+        free-text query: the query is vectorized with the fitted vocabulary (one sparse row),
+        so only one matrix-vector product is computed. Products sharing no term are not returned.
+        """
+        query_vector = self.vectorizer.transform([str(query)])
+        if query_vector.nnz == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        similarities = (self.tfidf_matrix @ query_vector.T).toarray().ravel()
+        similarities[similarities <= 0] = -np.inf
+        positions = top_n_indices(similarities, top_n)
+        return positions, similarities[positions]
+
+    def save(self, path=DEFAULT_CONTENT_MODEL_PATH):
+        joblib.dump({'item_ids': self.item_ids, 'vectorizer': self.vectorizer,
+                     'tfidf_matrix': self.tfidf_matrix, 'version': self.version}, path)
+
+def load_content_model(path=DEFAULT_CONTENT_MODEL_PATH):
+    """Loads a model written by ContentModel.save(), or returns None if there is none."""
+    if not os.path.exists(path):
+        return None
+    state = joblib.load(path)
+    return ContentModel(state['item_ids'], state['vectorizer'], state['tfidf_matrix'], state['version'])
+
+def get_content_model(data, path=DEFAULT_CONTENT_MODEL_PATH):
+    """Returns the content model for the current catalog, from disk when it matches or fitted once."""
+    def load_or_fit(data):
+        version = catalog_version(data, CONTENT_COLUMNS)
+        model = load_content_model(path)
+        if model is not None and model.version == version:
+            return model
+        return ContentModel.fit(data, version)
+
+    return cached_build('content_model', data, CONTENT_COLUMNS, load_or_fit)
+
 def content_based_recommendation(data, item_name, top_n=10):
-    if item_name not in data['Name'].values:
+    catalog = get_catalog_index(data)
+    catalog_position = catalog.position_of_name(item_name)
+    if catalog_position is None:
         print(f"item '{item_name}' not found in the data.")
         return pd.DataFrame()
-    tfidf_vectorizer = TfidfVectorizer(stop_words='english')
-    tfidf_matrix_content = tfidf_vectorizer.fit_transform(data['Tags'])
-    cosine_similarity_content = cosine_similarity(tfidf_matrix_content, tfidf_matrix_content)
-    # Find the index LABEL of the item
-    item_label_index = data[data['Name']==item_name].index[0]
-    # Convert LABEL to POSITION (for matrix access)
-    item_position = data.index.get_loc(item_label_index)
     
-    similar_items = list(enumerate(cosine_similarity_content[item_position]))
-    similar_prod = sorted(similar_items, key=lambda x:x[1], reverse=True)
-    top_similar_prod = similar_prod[:top_n]
-    recommended_items_indices = [x[0] for x in top_similar_prod]
-    recommended_item_details = data.iloc[recommended_items_indices][['ProdID', 'Name', 'ImageURL', 'Brand', 'Rating', 'ReviewCount']]
+    model = get_content_model(data)
+    item_position = model.position_of_product(catalog.product_ids[catalog_position])
+    recommended_items_indices, similarities = model.similar_items(item_position, top_n)
+    recommended_item_details, kept = catalog.take(model.item_ids[recommended_items_indices], ['ProdID', 'Name', 'ImageURL', 'Brand', 'Rating', 'ReviewCount'], return_mask=True)
+    recommended_item_details = recommended_item_details.assign(Score=similarities[kept])
     return recommended_item_details
-# Then write this in the same file
+
+def text_search_recommendation(data, query, top_n=10):
+    """Products matching a free-text query (no exact product name needed), best match first."""
+    model = get_content_model(data)
+    positions, similarities = model.search(query, top_n)
+    if len(positions) == 0:
+        return pd.DataFrame()
+    recommended_item_details, kept = get_catalog_index(data).take(model.item_ids[positions], ['ProdID', 'Name', 'ImageURL', 'Brand', 'Rating', 'ReviewCount'], return_mask=True)
+    return recommended_item_details.assign(Score=similarities[kept])
 
 # TO test the system
 if __name__ == "__main__":
@@ -36,6 +116,9 @@ if __name__ == "__main__":
     else:
         print("Failed to load data from Firebase")
         exit()
+    # Fit once and persist, so the app loads the model instead of refitting it
+    ContentModel.fit(data, catalog_version(data, CONTENT_COLUMNS)).save()
     item_name = "OPI Infinite Shine, Nail Lacquer Nail Polish, Bubble Bath"
     result = content_based_recommendation(data, item_name, top_n=5)
     print(result)
+    print(text_search_recommendation(data, "nail polish", top_n=5))
@@ -3,12 +3,14 @@ import pandas as pd
 import numpy as np
 import random
 import streamlit.components.v1 as components
+import os
 from chatbot import render_chatbot_ui
 from preprocess_data import process_data
 from rating_based_recommendation import get_top_rated_items
-from content_based_filtering import content_based_recommendation
-from collaborative_based_filtering import collaborative_filtering_recommendations
-from hybrid_approach import hybrid_recommendation_filtering
+from rating_aggregator import apply_rating, apply_ratings, unplaced_ratings
+from als_recommender import als_recommendations
+from precompute_recommendations import precomputed_recommendations, DEFAULT_TOP_N as PRECOMPUTED_TOP_N
+from recommendation_pipeline import HOME_PIPELINE, DETAIL_PIPELINE, SEARCH_PIPELINE, RecommendationRequest, warm_up
 from item_based_collaborative_filtering import item_based_collaborative_filtering
 import io
 import io
@@ -324,9 +326,20 @@ def toggle_wishlist_func(prod_id):
     else:
         user_list.append(prod_id)
     
-    # Save to Firebase immediately if user is logged in
+    # Queue the write if user is logged in; it reaches Firebase in the background
     if target_uid != 0:
-        update_wishlist_in_firebase(target_uid, user_list)
+        queue_wishlist_update(target_uid, user_list)
+def rate_product_func(product_row, data, rating_key):
+    """Callback for the star rating: Top Rated and the recommenders see it at once, then it is stored."""
+    stars = st.session_state.get(rating_key)
+    target_uid = st.session_state.get('target_user_id', 0)
+    if stars is None or target_uid == 0:
+        return
+    # st.feedback("stars") gives 0-4
+    rating = stars + 1
+    apply_rating(data, target_uid, product_row['ProdID'], rating)
+    if save_rating_to_firebase(target_uid, product_row['ProdID'], rating):
+        st.toast(f"Thanks! You rated this product {rating} ⭐")
 def clear_query_params():
     """Clears query params to prevent sticking to the detail view on refresh."""
     current_uid = st.query_params.get("user_id")
@@ -334,30 +347,73 @@ def clear_query_params():
     if current_uid:
         st.query_params["user_id"] = current_uid
 
-from firebase_utils import get_data_from_firebase, get_users_from_firebase, save_user_to_firebase, initialize_firebase_app, get_wishlist_from_firebase, update_wishlist_in_firebase
+# Engine behind "Recommended for You": 'cosine' (user-based CF) or 'als' (matrix factorization)
+PERSONALIZED_RECOMMENDER = os.environ.get('PERSONALIZED_RECOMMENDER', 'cosine')
+# Rating a wishlisted product counts as when folded into the ALS user vector
+WISHLIST_RATING = 5.0
+
+def personalized_recommendations(data, target_user_id, top_n=10, wishlist=()):
+    """"Recommended for You" from the configured engine."""
+    if PERSONALIZED_RECOMMENDER == 'als':
+        # Fold the session's wishlist in as implicit feedback, with the ratings a new sign-up
+        # gave since the catalog was loaded (not in the interaction matrix), so new users get
+        # recommendations and changes show up without retraining
+        ratings = {prod_id: WISHLIST_RATING for prod_id in wishlist}
+        ratings.update(unplaced_ratings(data, target_user_id))
+        if ratings:
+            return als_recommendations(data, target_user_id, top_n=top_n, ratings=ratings)
+    # Served from user_recommendations.npz when precomputed for this catalog by the same engine, else computed live
+    return precomputed_recommendations(data, target_user_id=target_user_id, top_n=top_n, engine=PERSONALIZED_RECOMMENDER)
 
-@st.cache_data
+def personalized_candidates(wishlist):
+    """
+    Candidate generator over personalized_recommendations for the recommendation pipelines.
+    The wishlist is read here, in the script thread: pipeline generators run on worker
+    threads, which have no access to st.session_state.
+    """
+    def generate(data, request, limit):
+        if request.user_id is None:
+            return None
+        # No more than the precomputed table holds, so the table serves it
+        recs = personalized_recommendations(data, request.user_id, top_n=min(limit, PRECOMPUTED_TOP_N), wishlist=wishlist)
+        if recs.empty:
+            return None
+        return recs['ProdID'].to_numpy(), recs['Score'].to_numpy()
+    return generate
+
+def run_recommendation_pipeline(pipeline, data, surface, top_n, **request):
+    """Runs a surface's pipeline (with the personalized generator) and keeps its stage timings in the session."""
+    wishlist = st.session_state.get('wishlists', {}).get(request.get('user_id'), [])
+    pipeline = pipeline.with_generator('personalized', personalized_candidates(list(wishlist)))
+    result = pipeline.recommend(data, RecommendationRequest(**request), top_n=top_n)
+    st.session_state.setdefault('recommendation_timings', {})[surface] = result.timings
+    return result.recommendations
+
+from firebase_utils import load_catalog_from_snapshot, get_user_from_firebase, find_user_by_email, save_user_to_firebase, save_rating_to_firebase, get_ratings_from_firebase, initialize_firebase_app, get_wishlist_from_firebase, queue_wishlist_update, flush_wishlist_updates
+
+@st.cache_resource(ttl=600)
 def load_and_process_data():
-    """Loads and processes the dataset from Firebase Realtime Database."""
+    """
+    Loads and processes the dataset from Firebase Realtime Database.
+    Cached as a shared resource (not copied per rerun) so the recommenders' per-catalog
+    models and indexes are reused across reruns. Treat the returned DataFrame as read-only.
+    On expiry only the published catalog version is checked; the local snapshot
+    (catalog_snapshot.parquet) is reused unless /products changed.
+    """
     try:
-        # Load from Firebase instead of local CSV
-        raw_data = get_data_from_firebase()
+        # process_data coerces ProdID/ID and applies the compact dtype schema
+        data = load_catalog_from_snapshot(process_data)
         
-        if raw_data is None or raw_data.empty:
+        if data is None or data.empty:
             st.error("Failed to load data from Firebase.")
             return None
-            
-        data = process_data(raw_data)
-        
-        # Ensure ProdID is consistent (int)
-        if 'ProdID' in data.columns:
-            # First coerce to numeric to handle empty strings or 'nan'
-            data['ProdID'] = pd.to_numeric(data['ProdID'], errors='coerce')
-            data = data.dropna(subset=['ProdID'])
-            data['ProdID'] = data['ProdID'].astype(int)
-
-        if 'ImageURL' in data.columns:
-            data['ImageURL'] = data['ImageURL'].astype(str)
+        if 'Price' not in data.columns:
+            # Added here, before the frame is shared, instead of on every rerun
+            data['Price'] = np.random.RandomState(42).uniform(15.0, 100.0, size=len(data)).round(2)
+        # Build the recommendation indexes now, so page requests stay within their latency budgets
+        warm_up(data, engine=PERSONALIZED_RECOMMENDER)
+        # Ratings given in the app are stored apart from /products; apply them on top
+        apply_ratings(data, get_ratings_from_firebase())
         return data
     except Exception as e:
         st.error(f"Error processing data: {e}")
@@ -508,8 +564,7 @@ def show_payment():
     
     # Pre-fill data from user profile if available
     target_user_id = st.session_state.get('target_user_id', 0)
-    users_db = get_users_from_firebase() # Ensure we have latest
-    u_data = users_db.get(str(target_user_id), {})
+    u_data = get_user_from_firebase(target_user_id) or {}
     
     with st.container():
         shipping_name = st.text_input("Receiver Name", value=u_data.get('name', ''), key="ship_name")
@@ -630,10 +685,14 @@ def view_product_details(product_row, data):
         if st.button("Add to Cart", key="btn_detail_add"):
             st.session_state['cart_items'].append(product_row.to_dict())
             st.toast(f"Added {product_row.get('Name')[:20]}... to cart! 🛒 ({len(st.session_state['cart_items'])})")
+        if st.session_state.get('target_user_id', 0) != 0:
+            st.markdown("#### Rate this product")
+            rating_key = f"rate_{current_id}"
+            st.feedback("stars", key=rating_key, on_change=rate_product_func, args=(product_row, data, rating_key))
     st.markdown('<hr style="margin-top: 15px; margin-bottom: 15px; border: 0; border-top: 1px solid #eee;">', unsafe_allow_html=True)
     st.markdown("<div class='section-header'>✨ Similar Items</div>", unsafe_allow_html=True)
     try:
-        similar_items = content_based_recommendation(data, item_name=product_row['Name'], top_n=4)
+        similar_items = run_recommendation_pipeline(DETAIL_PIPELINE, data, "detail", top_n=4, product_id=current_id)
         similar_items = sort_by_rating(similar_items)
         display_product_grid(similar_items, section_key="detail_rec_content")
     except Exception as e:
@@ -757,8 +816,6 @@ def login_page(data):
         st.markdown('<p style="text-align: center; color: #666;">Please login or sign up to continue</p>', unsafe_allow_html=True)
         
         tab1, tab2 = st.tabs(["Login", "Sign Up"])
-        
-        users_db = get_users_from_firebase()
 
         with tab1:
             with st.form("login_form"):
@@ -776,19 +833,15 @@ def login_page(data):
                         
                         # 1. Determine if Email or User ID
                         if "@" in input_str:
-                            # Search by Email in users_db
-                            for uid, u_data in users_db.items():
-                                if u_data.get('email', '').lower() == input_str.lower():
-                                    user_info = u_data
-                                    uid_str = uid
-                                    break
-                            
+                            # Look up the email index
+                            uid_str, user_info = find_user_by_email(input_str)
+
                             if not user_info:
                                 st.error("Email not found. Please sign up.")
                         else:
                             # Assume User ID
                             uid_str = input_str
-                            user_info = users_db.get(uid_str)
+                            user_info = get_user_from_firebase(uid_str)
                         
                         # 2. Validate Password if user found in Firebase
                         if user_info:
@@ -843,7 +896,7 @@ def login_page(data):
                         # Generate unique random ID
                         while True:
                             random_id = random.randint(100000, 999999)
-                            if str(random_id) not in users_db and random_id not in data['ID'].values:
+                            if random_id not in data['ID'].values and get_user_from_firebase(random_id) is None:
                                 break
                         
                         new_user = {
@@ -915,8 +968,6 @@ def main():
     if 'logged_in' not in st.session_state:
         st.session_state['logged_in'] = False
     
-    users_db = get_users_from_firebase()
-
     # Try to restore session from URL if not logged in
     if not st.session_state['logged_in']:
         qp_uid = st.query_params.get("user_id")
@@ -924,10 +975,11 @@ def main():
             try:
                 restored_uid_str = str(qp_uid)
                 # Check /users node first
-                if restored_uid_str in users_db:
+                restored_user = get_user_from_firebase(restored_uid_str)
+                if restored_user is not None:
                      st.session_state['logged_in'] = True
                      st.session_state['target_user_id'] = int(restored_uid_str)
-                     st.session_state['user_email'] = users_db[restored_uid_str].get('email')
+                     st.session_state['user_email'] = restored_user.get('email')
                      
                      # Restore Wishlist
                      if 'wishlists' not in st.session_state: st.session_state['wishlists'] = {}
@@ -952,9 +1004,6 @@ def main():
         st.success("🎉 Payment successful! Your order has been placed.")
         st.session_state["payment_done"] = False
 
-    if 'Price' not in data.columns:
-        np.random.seed(42)                                       
-        data['Price'] = np.random.uniform(15.0, 100.0, size=len(data)).round(2)
     if 'cart_items' not in st.session_state:
         st.session_state['cart_items'] = []
     if 'wishlists' not in st.session_state:
@@ -1200,7 +1249,7 @@ def main():
              st.write(f"**User ID:** {target_user_id}")
              
              # Fetch latest data
-             u_data = users_db.get(str(target_user_id), {})
+             u_data = get_user_from_firebase(target_user_id) or {}
              if not u_data:
                  u_data = {'user_id': target_user_id, 'email': st.session_state.get('user_email', '')}
              
@@ -1228,8 +1277,6 @@ def main():
                      # (Though getting from DB should have it)
                      if save_user_to_firebase(u_data):
                          st.success("Profile updated successfully!")
-                         # Update local db cache strictly for this user to reflect valid state immediately
-                         users_db[str(target_user_id)] = u_data
                          st.rerun()
                      else:
                          st.error("Failed to update profile.")
@@ -1245,7 +1292,7 @@ def main():
                   reset_btn = st.form_submit_button("Update Password")
                   
                   if reset_btn:
-                       u_data = users_db.get(str(target_user_id))
+                       u_data = get_user_from_firebase(target_user_id)
                        if not u_data:
                             st.error("User record not found.")
                        elif str(u_data.get('password')) != curr_pass:
@@ -1267,6 +1314,8 @@ def main():
              # 3. Logout
              st.subheader("Session")
              if st.button("Log Out", type="primary"):
+                  # Session end: write any queued wishlist change before forgetting the user
+                  flush_wishlist_updates(target_user_id)
                   for key in list(st.session_state.keys()):
                        del st.session_state[key]
                   st.query_params.clear()
@@ -1291,7 +1340,7 @@ def main():
                      search_results = sort_by_rating(search_results)
                 if search_results.empty:
                     st.warning(f"No products found matching '{search_query}'. Trying hybrid recommendation...")
-                    search_results = hybrid_recommendation_filtering(data, item_name=search_query, target_user_id=target_user_id, top_n=10)
+                    search_results = run_recommendation_pipeline(SEARCH_PIPELINE, data, "search", top_n=10, user_id=target_user_id, query=search_query)
                     search_results = sort_by_rating(search_results)
                     if search_results.empty:
                         st.error("No results found.")
@@ -1458,14 +1507,14 @@ def main():
                     pass
                 if target_user_id!=0:
                     st.markdown(f"<div class='section-header'>💙 Recommended for You (User {target_user_id})</div>", unsafe_allow_html=True)
-                try:
-                    collab_recs = collaborative_filtering_recommendations(data, target_user_id=target_user_id, top_n=12)
-                    collab_recs = sort_by_rating(collab_recs)
-                    collab_recs = collab_recs.iloc[:12]
-                    if not collab_recs.empty:
-                        display_product_grid(collab_recs, section_key="collab")
-                except:
-                    pass
+                    try:
+                        collab_recs = run_recommendation_pipeline(HOME_PIPELINE, data, "home", top_n=12, user_id=target_user_id)
+                        collab_recs = sort_by_rating(collab_recs)
+                        collab_recs = collab_recs.iloc[:12]
+                        if not collab_recs.empty:
+                            display_product_grid(collab_recs, section_key="collab")
+                    except:
+                        pass
     
             # Top Deals also only show if not searching
             if not search_active:
@@ -1,7 +1,6 @@
 # evaluation_metrics.py
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 from firebase_utils import get_data_from_firebase
 data = get_data_from_firebase()
@@ -10,6 +9,11 @@ if data is None:
     exit()
 
 from preprocess_data import process_data
+from interaction_matrix import get_interaction_matrix
+from collaborative_based_filtering import score_items_for_user, DEFAULT_K_NEIGHBORS
+from ranking import top_n_indices
+from als_recommender import get_als_model
+from user_neighbor_index import get_user_neighbor_index, neighbor_recall_at_k
 
 def train_test_split_by_user(data, test_size=0.2):
     train_data = []
@@ -32,23 +36,19 @@ def get_relevant_items(test_data, user_id):
         ]["ProdID"]
     )
 
-def collaborative_filtering_recommendations_ids(data, target_user_id, top_n=10):
-    user_item_matrix = data.pivot_table(
-        index='ID', columns='ProdID', values='Rating', aggfunc='mean'
-    ).fillna(0)
+def collaborative_filtering_recommendations_ids(data, target_user_id, top_n=10, k_neighbors=DEFAULT_K_NEIGHBORS):
+    interactions = get_interaction_matrix(data)
+    target_user_index = interactions.user_code(target_user_id)
+    if target_user_index is None:
+        return []
 
-    user_similarity = cosine_similarity(user_item_matrix)
-    target_user_index = user_item_matrix.index.get_loc(target_user_id)
+    scores = score_items_for_user(interactions, target_user_index, k_neighbors)
+    return list(interactions.item_ids[top_n_indices(scores, top_n)])
 
-    similar_users = user_similarity[target_user_index].argsort()[::-1][1:]
-    recommended_items = []
-
-    for user_index in similar_users:
-        rated_items = user_item_matrix.iloc[user_index]
-        not_rated = (rated_items > 0) & (user_item_matrix.iloc[target_user_index] == 0)
-        recommended_items.extend(user_item_matrix.columns[not_rated])
-
-    return list(dict.fromkeys(recommended_items))[:top_n]
+def als_recommendations_ids(data, target_user_id, top_n=10, **als_params):
+    model = get_als_model(data, **als_params)
+    top_items, _ = model.recommend(target_user_id, top_n)
+    return list(model.interactions.item_ids[top_items])
 
 def precision_recall_at_k(recommended_items, relevant_items):
     if not recommended_items:
@@ -63,7 +63,7 @@ def precision_recall_at_k(recommended_items, relevant_items):
 
     return precision, recall
 
-def evaluate_model(data):
+def evaluate_model(data, recommend_ids=collaborative_filtering_recommendations_ids):
     train_data, test_data = train_test_split_by_user(data)
 
     precisions = []
@@ -74,7 +74,7 @@ def evaluate_model(data):
         if not relevant_items:
             continue
 
-        recommended_items = collaborative_filtering_recommendations_ids(
+        recommended_items = recommend_ids(
             train_data, user_id, top_n=20
         )
 
@@ -90,4 +90,18 @@ def evaluate_model(data):
 precision, recall = evaluate_model(data)
 
 print(f"Precision@10: {precision:.4f}")
-print(f"Recall@10: {recall:.4f}")
\ No newline at end of file
+print(f"Recall@10: {recall:.4f}")
+
+# Matrix factorization (ALS) on the same split
+precision, recall = evaluate_model(data, als_recommendations_ids)
+
+print(f"ALS Precision@10: {precision:.4f}")
+print(f"ALS Recall@10: {recall:.4f}")
+
+# Approximate user-neighbour index (LSH) against exact cosine search
+neighbor_index = get_user_neighbor_index(data)
+recall, ann_ms, exact_ms = neighbor_recall_at_k(neighbor_index, k=DEFAULT_K_NEIGHBORS)
+
+print(f"User index: {neighbor_index.n_tables} tables x {neighbor_index.n_bits} bits, {neighbor_index.probes} probes, "
+      f"built in {neighbor_index.build_seconds:.2f}s, {neighbor_index.nbytes / 1e6:.1f} MB")
+print(f"Neighbour Recall@{DEFAULT_K_NEIGHBORS}: {recall:.4f} ({ann_ms:.2f} ms/query vs {exact_ms:.2f} ms exact)")
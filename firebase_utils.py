@@ -1,12 +1,20 @@
 
 import firebase_admin
 from firebase_admin import credentials
-from firebase_admin import db
 import pandas as pd
 import streamlit as st
 import os
 
+from catalog_snapshot import CATALOG_VERSION_PATH, load_catalog
+from catalog_sync import RATINGS_PATH, SERVER_TIMESTAMP, UPDATED_AT, CatalogSync, rating_key
+from storage import get_database, is_firebase_backend
+from user_repository import UserRepository
+from wishlist_writer import WishlistWriter
+
 def initialize_firebase_app():
+    # A local storage backend (STORAGE_BACKEND=sqlite/memory) needs no Firebase app
+    if not is_firebase_backend():
+        return
     # Singleton pattern for Firebase app to avoid "App already exists" errors in Streamlit
     if not firebase_admin._apps:
         try:
@@ -36,13 +44,12 @@ def initialize_firebase_app():
             else:
                  st.error(f"Failed to initialize Firebase: {error_msg}")
 
-@st.cache_data(ttl=600)  # Cache for 10 minutes to avoid hitting DB on every interaction
-def get_data_from_firebase():
+def fetch_products_from_firebase():
     """
-    Fetches product data from Firebase Realtime Database and returns a Pandas DataFrame.
+    Fetches product data from Firebase Realtime Database and returns a Pandas DataFrame (uncached).
     """
     try:
-        ref = db.reference('/products')
+        ref = get_database().reference('/products')
         data = ref.get()
         
         if data:
@@ -64,13 +71,111 @@ def get_data_from_firebase():
         st.error(f"Error fetching data from Firebase: {e}")
         return None
 
+@st.cache_data(ttl=600)  # Cache for 10 minutes to avoid hitting DB on every interaction
+def get_data_from_firebase():
+    """
+    Fetches product data from Firebase Realtime Database and returns a Pandas DataFrame.
+    """
+    return fetch_products_from_firebase()
+
+def get_catalog_version_from_firebase():
+    """
+    Reads the published catalog version (a single small node), or None if none was published.
+    Raises when the database cannot be reached, so callers can tell offline from unpublished.
+    """
+    return get_database().reference(CATALOG_VERSION_PATH).get()
+
+_catalog_sync = None
+
+def fetch_products_incrementally():
+    """
+    Returns the raw product catalog. The first call downloads /products once;
+    later calls fetch only records changed since (see catalog_sync).
+    """
+    global _catalog_sync
+    try:
+        if _catalog_sync is None:
+            _catalog_sync = CatalogSync(get_database())
+        return _catalog_sync.fetch()
+    except Exception as e:
+        st.error(f"Error syncing data from Firebase: {e}")
+        return None
+
+def load_catalog_from_snapshot(process):
+    """
+    Returns the processed catalog from the local snapshot, syncing /products
+    only when the version published in Firebase differs from the snapshot.
+    """
+    return load_catalog(get_catalog_version_from_firebase, fetch_products_incrementally, process)
+
+def save_rating_to_firebase(user_id, product_id, rating):
+    """
+    Stores a user's rating under /ratings, one record per user and product so rating again
+    overwrites it. /products and the catalog version are left alone, so the snapshot and
+    the offline indexes/models stay current; app instances apply the stored ratings on top
+    of the catalog at their next reload (see get_ratings_from_firebase).
+    """
+    try:
+        user_id, product_id = int(user_id), int(product_id)
+        get_database().reference(RATINGS_PATH).child(rating_key(user_id, product_id)).set({
+            'ID': user_id, 'ProdID': product_id, 'Rating': float(rating), UPDATED_AT: dict(SERVER_TIMESTAMP)})
+        return True
+    except Exception as e:
+        st.error(f"Error saving rating: {e}")
+        return False
+
+_ratings_sync = None
+
+def get_ratings_from_firebase():
+    """
+    Returns the ratings stored by the app as a DataFrame (ID, ProdID, Rating), or None if
+    there are none. The first call downloads /ratings; later calls fetch only new ratings.
+    """
+    global _ratings_sync
+    try:
+        if _ratings_sync is None:
+            _ratings_sync = CatalogSync(get_database(), RATINGS_PATH)
+        return _ratings_sync.fetch()
+    except Exception as e:
+        st.error(f"Error fetching ratings: {e}")
+        return None
+
+_user_repository = None
+
+def get_user_repository():
+    global _user_repository
+    if _user_repository is None:
+        _user_repository = UserRepository(get_database())
+    return _user_repository
+
+def get_user_from_firebase(user_id):
+    """
+    Fetches one user account from /users/{user_id} (cached briefly). Returns the user data or None.
+    """
+    try:
+        return get_user_repository().get(user_id)
+    except Exception as e:
+        st.error(f"Error fetching user: {e}")
+        return None
+
+def find_user_by_email(email):
+    """
+    Looks up a user by email through the /user_emails index. Returns (user_id, user_data) or (None, None).
+    """
+    try:
+        return get_user_repository().find_by_email(email)
+    except Exception as e:
+        st.error(f"Error fetching user: {e}")
+        return None, None
+
 def get_users_from_firebase():
     """
     Fetches all user accounts from Firebase /users node.
     Returns a dictionary of user_id -> user_data.
+    Downloads the whole node; use get_user_from_firebase / find_user_by_email for lookups.
     """
     try:
-        ref = db.reference('/users')
+        ref = get_database().reference('/users')
         users_data = ref.get()
         if users_data:
             return users_data
@@ -88,9 +193,8 @@ def save_user_to_firebase(user_data):
         if 'user_id' not in user_data:
             return False
             
-        user_id = str(user_data['user_id'])
-        ref = db.reference(f'/users/{user_id}')
-        ref.set(user_data)
+        # Also updates the email index and invalidates the cached record
+        get_user_repository().save(user_data)
         return True
     except Exception as e:
         st.error(f"Error saving user: {e}")
@@ -100,8 +204,12 @@ def get_wishlist_from_firebase(user_id):
     """
     Fetches the wishlist (list of product IDs) for a specific user from /users/{user_id}/wishlist.
     """
+    # A change still waiting in the write-behind queue is newer than the database
+    pending = get_wishlist_writer().pending(user_id)
+    if pending is not None:
+        return pending
     try:
-        ref = db.reference(f'/users/{user_id}/wishlist')
+        ref = get_database().reference(f'/users/{user_id}/wishlist')
         wishlist_data = ref.get()
         if wishlist_data:
             if isinstance(wishlist_data, list):
@@ -112,17 +220,42 @@ def get_wishlist_from_firebase(user_id):
         st.error(f"Error fetching wishlist: {e}")
         return []
 
+def _write_wishlist(user_id, wishlist_items):
+    ref = get_database().reference(f'/users/{user_id}/wishlist')
+    # We save directly as a list
+    ref.set(wishlist_items)
+    get_user_repository().invalidate(user_id)
+
+_wishlist_writer = None
+
+def get_wishlist_writer():
+    global _wishlist_writer
+    if _wishlist_writer is None:
+        _wishlist_writer = WishlistWriter(_write_wishlist)
+    return _wishlist_writer
+
 def update_wishlist_in_firebase(user_id, wishlist_items):
     """
-    Updates the wishlist for a user.
+    Updates the wishlist for a user (synchronous write).
     wishlist_items: list of product IDs (int or str)
     """
     try:
-        ref = db.reference(f'/users/{user_id}/wishlist')
-        # We save directly as a list
-        ref.set(wishlist_items)
+        _write_wishlist(user_id, wishlist_items)
         return True
     except Exception as e:
         st.error(f"Error updating wishlist: {e}")
         return False
 
+def queue_wishlist_update(user_id, wishlist_items):
+    """
+    Queues the wishlist write without waiting for the database (see wishlist_writer).
+    Repeated updates of the same user are coalesced. Returns a ticket for get_wishlist_writer().wait().
+    """
+    return get_wishlist_writer().enqueue(user_id, wishlist_items)
+
+def flush_wishlist_updates(user_id=None):
+    """
+    Writes queued wishlist changes now (e.g. at logout).
+    """
+    return get_wishlist_writer().flush(user_id)
+
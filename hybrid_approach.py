@@ -1,16 +1,178 @@
+"""
+Hybrid recommendations: the component recommenders run concurrently in a shared thread pool
+(their matrix products release the GIL), and their results are fused on ProdID.
+
+Fusion methods:
+  'weighted'  each component's scores are min-max normalized to [0, 1], then summed with `weights`
+  'rrf'       reciprocal rank fusion: sum of weight / (rrf_k + rank), which ignores score scales
+
+A component that fails or does not answer within its timeout is left out of the fusion,
+so one slow recommender cannot stall the page; its thread finishes in the background.
+While it does, the same call is not started again, and at most a few calls of each
+component are left running (Stragglers), so timed-out calls cannot fill the pool.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
 import pandas as pd
 import numpy as np
 
 from preprocess_data import process_data
 from rating_based_recommendation import get_top_rated_items
-from content_based_filtering import content_based_recommendation
+from catalog_index import get_catalog_index
+from content_based_filtering import content_based_recommendation, text_search_recommendation
 from collaborative_based_filtering import collaborative_filtering_recommendations
 
-def hybrid_recommendation_filtering(data:pd.DataFrame, item_name:str, target_user_id:int, top_n:int = 10):
-    content_based_rec = content_based_recommendation(data,item_name, top_n)
-    collaborative_based_rec=collaborative_filtering_recommendations(data, target_user_id, top_n)
-    hybrid_approach = (pd.concat([content_based_rec, collaborative_based_rec]).drop_duplicates().head(top_n))
-    return hybrid_approach
+DETAIL_COLUMNS = ['ProdID', 'Name', 'ImageURL', 'Brand', 'Rating', 'ReviewCount']
+DEFAULT_WEIGHTS = {'content': 0.5, 'collaborative': 0.5}
+# Seconds a component may take before it is left out of the result
+DEFAULT_TIMEOUT = 2.0
+# Damping constant of reciprocal rank fusion (Cormack et al.)
+RRF_K = 60
+
+# Timed-out calls of one component allowed to keep running before it is left out of new requests
+STRAGGLER_LIMIT = 2
+
+# Shared by all requests; a pool per call would wait for timed-out components on shutdown
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='hybrid')
+
+
+class Stragglers:
+    """
+    Calls that ran past their timeout and are still running, by component name and request key.
+    A component is held back while the same call (same key) is still running, or while
+    `limit` calls of it are, e.g. all waiting for the same slow build.
+    """
+
+    def __init__(self, limit=STRAGGLER_LIMIT):
+        self.limit = limit
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, key, future):
+        with self._lock:
+            self._running[(name, key)] = future
+        future.add_done_callback(lambda f: self._discard((name, key), f))
+
+    def _discard(self, entry, future):
+        with self._lock:
+            if self._running.get(entry) is future:
+                del self._running[entry]
+
+    def holds_back(self, name, key):
+        with self._lock:
+            if (name, key) in self._running:
+                return True
+            return sum(running_name == name for running_name, _ in self._running) >= self.limit
+
+
+def run_components(components, timeout=DEFAULT_TIMEOUT, executor=None, stragglers=None, key=None):
+    """
+    Runs {name: callable} concurrently and returns ({name: result}, {name: seconds}) for the
+    components that finished within their timeout (a number, or {name: seconds}) without raising.
+    executor: pool to run them on (default: the shared hybrid pool).
+    stragglers: Stragglers that records the calls left running here; components it holds
+    back are left out instead of taking another worker. key: what identifies the request
+    (e.g. the user), so a slow call only holds back the same call.
+    """
+    started = time.perf_counter()
+    executor = _executor if executor is None else executor
+    futures = {}
+    for name, func in components.items():
+        if stragglers is not None and stragglers.holds_back(name, key):
+            print(f"{name} recommendations still running from an earlier request; left out")
+            continue
+        futures[name] = executor.submit(_timed, func)
+    results, timings = {}, {}
+    for name, future in futures.items():
+        limit = timeout.get(name, DEFAULT_TIMEOUT) if isinstance(timeout, dict) else timeout
+        try:
+            results[name], timings[name] = future.result(timeout=max(0.0, started + limit - time.perf_counter()))
+        except FutureTimeoutError:
+            if stragglers is not None:
+                stragglers.add(name, key, future)
+            print(f"{name} recommendations timed out after {limit:.1f}s; left out")
+        except Exception as e:
+            print(f"{name} recommendations failed: {e}")
+    return results, timings
+
+
+_stragglers = Stragglers()
+
+
+def _timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def normalize_scores(scores):
+    """Min-max normalizes scores to [0, 1]; equal scores all map to 1."""
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(scores) == 0:
+        return scores
+    low, high = scores.min(), scores.max()
+    if high - low <= 0:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def fuse_recommendations(results, weights=None, method='weighted', top_n=10, rrf_k=RRF_K):
+    """
+    Fuses {component name: recommendations DataFrame (ProdID, ..., Score)} into one
+    DataFrame with one row per ProdID, ranked by the fused Score, best first.
+    Products found by several components add up their contributions.
+    """
+    weights = DEFAULT_WEIGHTS if weights is None else weights
+    fused, details = {}, []
+    for name, recs in results.items():
+        if recs is None or recs.empty or 'ProdID' not in recs:
+            continue
+        weight = weights.get(name, 1.0)
+        if 'Score' in recs:
+            recs = recs.sort_values('Score', ascending=False, kind='stable')
+        recs = recs.drop_duplicates('ProdID')
+        if method == 'rrf':
+            contributions = weight / (rrf_k + np.arange(1, len(recs) + 1))
+        elif method == 'weighted':
+            scores = recs['Score'] if 'Score' in recs else -np.arange(len(recs))
+            contributions = weight * normalize_scores(scores)
+        else:
+            raise ValueError(f"Unknown fusion method: {method}")
+        for product_id, contribution in zip(recs['ProdID'].tolist(), contributions.tolist()):
+            fused[product_id] = fused.get(product_id, 0.0) + contribution
+        details.append(recs[[col for col in DETAIL_COLUMNS if col in recs]])
+
+    if not fused:
+        return pd.DataFrame()
+    # First component's row wins for the product details; ties keep the component order
+    combined = pd.concat(details).drop_duplicates('ProdID')
+    combined = combined.assign(Score=combined['ProdID'].map(fused).to_numpy())
+    return combined.sort_values('Score', ascending=False, kind='stable').head(top_n).reset_index(drop=True)
+
+
+def hybrid_recommendation_filtering(data:pd.DataFrame, item_name:str, target_user_id:int, top_n:int = 10,
+                                    weights=None, method='weighted', timeout=DEFAULT_TIMEOUT):
+    """
+    Content-based recommendations for `item_name` fused with collaborative recommendations
+    for `target_user_id` (one row per ProdID, with the fused Score). When no product is
+    named exactly `item_name`, the content side matches it as free text instead.
+    weights: {'content': w, 'collaborative': w}; method: 'weighted' or 'rrf';
+    timeout: seconds per component, or {component: seconds}.
+    """
+    def content():
+        if get_catalog_index(data).position_of_name(item_name) is not None:
+            return content_based_recommendation(data, item_name, top_n)
+        return text_search_recommendation(data, item_name, top_n)
+
+    components = {
+        'content': content,
+        'collaborative': lambda: collaborative_filtering_recommendations(data, target_user_id, top_n),
+    }
+    results, _ = run_components(components, timeout, stragglers=_stragglers, key=(item_name, target_user_id))
+    return fuse_recommendations(results, weights, method, top_n)
 
 if __name__ == "__main__":
     from firebase_utils import get_data_from_firebase
@@ -29,3 +191,4 @@ if __name__ == "__main__":
 
     hybrid_rec = hybrid_recommendation_filtering(data, item_name, target_user_id, top_n)
     print(hybrid_rec)
+    print(hybrid_recommendation_filtering(data, item_name, target_user_id, top_n, method='rrf'))
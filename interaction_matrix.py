@@ -0,0 +1,247 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from catalog_cache import pinned_build
+
+INTERACTION_COLUMNS = ('ID', 'ProdID', 'Rating')
+
+
+class InteractionMatrix:
+    """
+    Sparse users x products rating matrix (CSR) shared by the recommenders.
+    Rows follow `user_ids` and columns follow `item_ids`, both sorted ascending
+    like the columns/index of data.pivot_table(index='ID', columns='ProdID').
+
+    Ratings set after the build (set_rating) are part of every read below; code scoring
+    users against each other should go through cosine_similarities / user_rows /
+    weighted_ratings rather than `matrix` and `normalized`, which hold the built ratings.
+    """
+
+    def __init__(self, matrix, user_ids, item_ids):
+        self.matrix = matrix
+        self.user_ids = np.asarray(user_ids)
+        self.item_ids = np.asarray(item_ids)
+        # Hash-based ID -> row/column code maps
+        self.user_index = pd.Index(self.user_ids)
+        self.item_index = pd.Index(self.item_ids)
+        self._item_user = None
+        self._normalized = None
+        # Ratings added after the build that have no slot in the CSR structure:
+        # user code -> {item code: rating}
+        self._added = {}
+        # User codes whose row changed since the build (set_rating)
+        self._updated_users = set()
+        # The _added ratings as a users x products CSR matrix, rebuilt after a change
+        self._overlay = None
+        # Guards the overlay and the in-place rating writes
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        # Pickled to send to worker processes: locks can't be pickled, and the derived
+        # views are cheaper to rebuild on the other side than to copy
+        with self._lock:
+            state = dict(self.__dict__)
+            state.update(_added={user: dict(added) for user, added in self._added.items()},
+                         _updated_users=set(self._updated_users))
+        state.update(_lock=None, _normalized=None, _item_user=None, _overlay=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def user_code(self, user_id):
+        """Returns the row of `user_id`, or None if the user has no ratings."""
+        try:
+            return self.user_index.get_loc(user_id)
+        except (KeyError, TypeError):
+            return None
+
+    def item_code(self, product_id):
+        """Returns the column of `product_id`, or None if the product has no ratings."""
+        try:
+            return self.item_index.get_loc(product_id)
+        except (KeyError, TypeError):
+            return None
+
+    def rated_items(self, user_code):
+        """Column codes rated by the user in row `user_code` (sorted)."""
+        start, end = self.matrix.indptr[user_code], self.matrix.indptr[user_code + 1]
+        with self._lock:
+            added = list(self._added.get(user_code, ()))
+        if added:
+            return np.union1d(self.matrix.indices[start:end], added)
+        return self.matrix.indices[start:end]
+
+    def user_row(self, user_code):
+        """The user's ratings as a 1 x products CSR row, including ratings set since the build."""
+        with self._lock:
+            row = self.matrix[user_code]
+            added = dict(self._added.get(user_code, {}))
+        if added:
+            extra = sparse.csr_matrix((list(added.values()), ([0] * len(added), list(added))),
+                                      shape=row.shape, dtype=row.dtype)
+            row = row + extra
+        return row
+
+    def normalized_row(self, user_code):
+        """L2-normalized user_row, for cosine similarity against `normalized`."""
+        with self._lock:
+            if user_code not in self._added:
+                return self.normalized[user_code]
+        return normalize(self.user_row(user_code), norm='l2')
+
+    def user_rows(self, user_codes):
+        """user_row for many users at once (CSR, len(user_codes) x products)."""
+        user_codes = np.asarray(user_codes)
+        with self._lock:
+            if not any(code in self._added for code in user_codes.tolist()):
+                return self.matrix[user_codes]
+        return sparse.vstack([self.user_row(code) for code in user_codes], format='csr')
+
+    def normalized_rows(self, user_codes):
+        """normalized_row for many users at once."""
+        user_codes = np.asarray(user_codes)
+        with self._lock:
+            if not any(code in self._added for code in user_codes.tolist()):
+                return self.normalized[user_codes]
+        return normalize(self.user_rows(user_codes), norm='l2')
+
+    def overlay_users(self):
+        """User codes with ratings added since the build (sorted)."""
+        with self._lock:
+            return np.array(sorted(self._added), dtype=np.int64)
+
+    def _overlay_matrix(self):
+        with self._lock:
+            if self._overlay is None:
+                rows = [(user, item, rating) for user, added in self._added.items() for item, rating in added.items()]
+                users, items, ratings = zip(*rows) if rows else ((), (), ())
+                self._overlay = sparse.csr_matrix((np.asarray(ratings, dtype=self.matrix.dtype), (users, items)),
+                                                  shape=self.shape)
+            return self._overlay
+
+    def cosine_similarities(self, query_rows):
+        """
+        Cosine similarity of every user to each L2-normalized query row (e.g. normalized_rows),
+        as a dense users x queries array. Users with added ratings are compared on their current row.
+        """
+        similarities = (self.normalized @ query_rows.T).toarray()
+        users = self.overlay_users()
+        if len(users):
+            similarities[users] = (self.normalized_rows(users) @ query_rows.T).toarray()
+        return similarities
+
+    def weighted_ratings(self, weights, binary=False):
+        """
+        weights (rows x users, sparse) times the users' ratings, added ratings included, as a
+        dense rows x products array. binary=True counts each rating as 1 (e.g. to sum the
+        weight of the users who rated each product).
+        """
+        matrix = (self.matrix != 0).astype(np.float64) if binary else self.matrix
+        result = (weights @ matrix).toarray()
+        with self._lock:
+            has_overlay = bool(self._added)
+        if has_overlay:
+            overlay = self._overlay_matrix()
+            result += (weights @ ((overlay != 0).astype(np.float64) if binary else overlay)).toarray()
+        return result
+
+    def is_updated(self, user_code):
+        """True if set_rating changed the user's row after the build."""
+        with self._lock:
+            return user_code in self._updated_users
+
+    def set_rating(self, user_code, item_code, rating):
+        """
+        Sets one rating in place and returns the rating it replaced (None if new).
+        An existing entry is overwritten in the CSR arrays (and the cached normalized and
+        item_user views); a new one is kept in a small per-user overlay read by user_row
+        and rated_items, since inserting into CSR would copy the whole matrix.
+        """
+        with self._lock:
+            self._updated_users.add(user_code)
+            start, end = self.matrix.indptr[user_code], self.matrix.indptr[user_code + 1]
+            pos = start + np.searchsorted(self.matrix.indices[start:end], item_code)
+            if pos < end and self.matrix.indices[pos] == item_code:
+                previous = float(self.matrix.data[pos])
+                self.matrix.data[pos] = rating
+                if self._normalized is not None:
+                    row = self.matrix.data[start:end]
+                    self._normalized.data[start:end] = row / np.sqrt(np.dot(row, row))
+                if self._item_user is not None:
+                    item_start, item_end = self._item_user.indptr[item_code], self._item_user.indptr[item_code + 1]
+                    item_pos = item_start + np.searchsorted(self._item_user.indices[item_start:item_end], user_code)
+                    self._item_user.data[item_pos] = rating
+                return previous
+            added = self._added.setdefault(user_code, {})
+            previous = added.get(item_code)
+            added[item_code] = rating
+            self._overlay = None
+            return previous
+
+    @property
+    def normalized(self):
+        """Row-wise L2-normalized matrix, so a row product gives cosine similarity."""
+        if self._normalized is None:
+            with self._lock:
+                if self._normalized is None:
+                    self._normalized = normalize(self.matrix, norm='l2', copy=True)
+        return self._normalized
+
+    @property
+    def item_user(self):
+        """Products x users view of the same ratings (CSR), built lazily."""
+        if self._item_user is None:
+            with self._lock:
+                if self._item_user is None:
+                    self._item_user = self.matrix.T.tocsr()
+        return self._item_user
+
+
+def build_interaction_matrix(data) -> InteractionMatrix:
+    """
+    Builds the sparse user-item matrix from a ratings DataFrame (one row per rating)
+    or from the already integer-coded interactions of a NormalizedCatalog.
+    """
+    if isinstance(data, pd.DataFrame):
+        ratings = pd.DataFrame({
+            'ID': data['ID'],
+            'ProdID': data['ProdID'],
+            'Rating': pd.to_numeric(data['Rating'], errors='coerce'),
+        }).dropna()
+        user_codes, user_ids = pd.factorize(ratings['ID'], sort=True)
+        item_codes, item_ids = pd.factorize(ratings['ProdID'], sort=True)
+        values = ratings['Rating'].to_numpy(dtype=np.float32)
+    else:
+        user_codes = data.interactions['user_code'].to_numpy()
+        item_codes = data.interactions['item_code'].to_numpy()
+        values = data.interactions['Rating'].to_numpy(dtype=np.float32)
+        user_ids, item_ids = data.user_ids, data.products['ProdID'].to_numpy()
+    shape = (len(user_ids), len(item_ids))
+
+    # Duplicate (user, product) pairs are summed by tocsr(); divide by their count
+    # to get the mean rating, matching pivot_table(aggfunc='mean')
+    sums = sparse.coo_matrix((values, (user_codes, item_codes)), shape=shape).tocsr()
+    counts = sparse.coo_matrix((np.ones_like(values), (user_codes, item_codes)), shape=shape).tocsr()
+    sums.data /= counts.data
+
+    # A 0 rating means "not rated" in the dense pivot (fillna(0)); keep that meaning
+    sums.eliminate_zeros()
+    return InteractionMatrix(sums, np.asarray(user_ids), np.asarray(item_ids))
+
+
+def get_interaction_matrix(data) -> InteractionMatrix:
+    """
+    Returns the cached interaction matrix, rebuilding it only when the ratings change.
+    Pinned rather than LRU-cached: ratings set in place must survive until the next catalog.
+    """
+    return pinned_build('interaction_matrix', data, INTERACTION_COLUMNS, build_interaction_matrix)
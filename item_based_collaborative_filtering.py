@@ -1,39 +1,31 @@
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+
+from item_neighbor_index import get_item_neighbor_index
+from catalog_index import get_catalog_index
 
 def item_based_collaborative_filtering(data, product_id, top_n=5):
     """
     Returns recommendations based on Item-Item Collaborative Filtering.
     (People who liked 'product_id' also liked...)
     """
-    # 1. Create User-Item Matrix
-    # Rows: Users, Columns: Products
-    user_item_matrix = data.pivot_table(index='ID', columns='ProdID', values='Rating', aggfunc='mean').fillna(0)
+    # 1. Get the precomputed Item-Item neighbour index
+    # (loaded from item_neighbors.npz or built once per catalog version)
+    item_index = get_item_neighbor_index(data)
     
-    # 2. Check if product exists in matrix
-    if product_id not in user_item_matrix.columns:
+    # 2. Check if product exists in the index
+    if product_id not in item_index:
         return pd.DataFrame()
     
-    # 3. Calculate Item-Item Similarity
-    # Transpose to get Item-User matrix, so cosine_similarity calculates similarity between items
-    item_user_matrix = user_item_matrix.T
-    item_similarity_matrix = cosine_similarity(item_user_matrix)
-    item_similarity_df = pd.DataFrame(item_similarity_matrix, index=item_user_matrix.index, columns=item_user_matrix.index)
-    
-    # 4. Get similar items
-    similar_items = item_similarity_df[product_id].sort_values(ascending=False)
-    
-    # Filter out the item itself and get top N
-    similar_items = similar_items.drop(product_id).head(top_n)
-    
-    # 5. Get details of recommended items
-    recommended_prod_ids = similar_items.index.tolist()
-    recommended_items_details = data[data['ProdID'].isin(recommended_prod_ids)][['Name','ReviewCount','Brand','ImageURL','Rating','ProdID']]
+    # 3. Get similar items (the item itself is never its own neighbour)
+    recommended_prod_ids, scores = item_index.similar_items(product_id, top_n)
+    if len(recommended_prod_ids) == 0:
+        return pd.DataFrame()
     
-    # Drop duplicates in case data has multiple entries per product
-    recommended_items_details = recommended_items_details.drop_duplicates(subset=['ProdID'])
+    # 4. Get details of recommended items
+    # The catalog index holds one row per product, so no duplicates to drop
+    recommended_items_details, kept = get_catalog_index(data).take(recommended_prod_ids, ['Name','ReviewCount','Brand','ImageURL','Rating','ProdID'], return_mask=True)
     
-    return recommended_items_details
+    return recommended_items_details.assign(Score=scores[kept])
 
 if __name__ == "__main__":
     # Test
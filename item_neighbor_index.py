@@ -0,0 +1,129 @@
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import normalize
+
+from catalog_cache import cached_build, catalog_version
+from interaction_matrix import INTERACTION_COLUMNS, get_interaction_matrix
+
+DEFAULT_INDEX_PATH = 'item_neighbors.npz'
+DEFAULT_NEIGHBORS = 50
+
+
+class ItemNeighborIndex:
+    """
+    Precomputed top-K most similar products for every ProdID ("Users Also Bought").
+    neighbors[i] holds int32 column codes into item_ids (padded with -1),
+    scores[i] the matching float32 cosine similarities, best first.
+    """
+
+    def __init__(self, item_ids, neighbors, scores, version=''):
+        self.item_ids = np.asarray(item_ids)
+        self.neighbors = neighbors
+        self.scores = scores
+        self.version = version
+        self._positions = {pid: pos for pos, pid in enumerate(self.item_ids.tolist())}
+
+    def __contains__(self, product_id):
+        return product_id in self._positions
+
+    def positions(self, product_ids):
+        """Rows of many ProdIDs at once (-1 where a ProdID is not in the index)."""
+        return np.array([self._positions.get(pid, -1) for pid in np.asarray(product_ids).tolist()], dtype=np.int64)
+
+    def similar_items(self, product_id, top_n=5):
+        """Returns (ProdIDs, scores) of the products most similar to `product_id`."""
+        pos = self._positions.get(product_id)
+        if pos is None:
+            return self.item_ids[:0], np.empty(0, dtype=np.float32)
+        codes = self.neighbors[pos, :top_n]
+        codes = codes[codes >= 0]
+        return self.item_ids[codes], self.scores[pos, :len(codes)]
+
+    def save(self, path=DEFAULT_INDEX_PATH):
+        # Write next to the target and swap it in, so a crash mid-write leaves the old index
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, item_ids=self.item_ids, neighbors=self.neighbors,
+                     scores=self.scores, version=np.array(self.version))
+        os.replace(tmp_path, path)
+
+
+def build_item_neighbor_index(interactions, k=DEFAULT_NEIGHBORS, chunk_size=1024, version=''):
+    """
+    Computes the top-k cosine neighbours of every product from the sparse item-user matrix.
+    Items are processed `chunk_size` rows at a time, so memory stays at chunk_size x n_items.
+    """
+    item_user = normalize(interactions.item_user, norm='l2', copy=True)
+    n_items = item_user.shape[0]
+    k = max(0, min(k, n_items - 1))
+
+    neighbors = np.full((n_items, k), -1, dtype=np.int32)
+    scores = np.zeros((n_items, k), dtype=np.float32)
+    if k == 0:
+        return ItemNeighborIndex(interactions.item_ids, neighbors, scores, version)
+
+    item_user_t = item_user.T.tocsc()
+    for start in range(0, n_items, chunk_size):
+        end = min(start + chunk_size, n_items)
+        sims = (item_user[start:end] @ item_user_t).toarray()
+        rows = np.arange(end - start)
+        # An item is not its own neighbour
+        sims[rows, rows + start] = -np.inf
+
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_sims = np.take_along_axis(top_sims, order, axis=1)
+
+        # Items that share no raters are not neighbours
+        top[top_sims <= 0] = -1
+        top_sims[top_sims <= 0] = 0
+        neighbors[start:end] = top
+        scores[start:end] = top_sims
+
+    return ItemNeighborIndex(interactions.item_ids, neighbors, scores, version)
+
+
+def load_item_neighbor_index(path=DEFAULT_INDEX_PATH):
+    """Loads an index written by ItemNeighborIndex.save(), or returns None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        return ItemNeighborIndex(f['item_ids'], f['neighbors'], f['scores'], str(f['version']))
+
+
+def get_item_neighbor_index(data: pd.DataFrame, path=DEFAULT_INDEX_PATH):
+    """
+    Returns the item neighbour index for the current catalog version.
+    Uses the file built offline when it matches the data, otherwise builds it in memory.
+    """
+    def load_or_build(data):
+        version = catalog_version(data, INTERACTION_COLUMNS)
+        index = load_item_neighbor_index(path)
+        if index is not None and index.version == version:
+            return index
+        return build_item_neighbor_index(get_interaction_matrix(data), version=version)
+
+    return cached_build('item_neighbor_index', data, INTERACTION_COLUMNS, load_or_build)
+
+
+if __name__ == "__main__":
+    # Offline build step: python item_neighbor_index.py
+    import time
+    from firebase_utils import get_data_from_firebase
+    from preprocess_data import process_data
+
+    raw_data = get_data_from_firebase()
+    if raw_data is None:
+        print("Failed to load data")
+        exit()
+    data = process_data(raw_data)
+
+    start = time.perf_counter()
+    index = build_item_neighbor_index(get_interaction_matrix(data),
+                                      version=catalog_version(data, INTERACTION_COLUMNS))
+    index.save(DEFAULT_INDEX_PATH)
+    print(f"Built neighbours for {len(index.item_ids)} products in {time.perf_counter() - start:.2f}s -> {DEFAULT_INDEX_PATH}")
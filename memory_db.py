@@ -0,0 +1,197 @@
+"""
+In-memory stand-in for firebase_admin.db (Realtime Database) for local runs and tests.
+
+Supports the subset of the API the app uses: reference(path), child(), get(), set(),
+update() with multi-path keys, delete(), push(), and order_by_child() queries with
+start_at / end_at / equal_to / limit_to_first / limit_to_last.
+Lists are stored as index-keyed children and read back as lists, like Firebase does.
+The server value {'.sv': 'timestamp'} is replaced by the current time in milliseconds.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+def _split(path):
+    return [part for part in str(path).split('/') if part]
+
+
+SERVER_TIMESTAMP = {'.sv': 'timestamp'}
+
+
+def _to_node(value):
+    """Converts a value to the stored form (lists become index-keyed dicts, None children dropped)."""
+    if value == SERVER_TIMESTAMP:
+        return time.time_ns() // 1_000_000
+    if isinstance(value, (list, tuple)):
+        value = {str(i): v for i, v in enumerate(value)}
+    if isinstance(value, dict):
+        node = {}
+        for key, child in value.items():
+            child = _to_node(child)
+            if child is not None:
+                node[str(key)] = child
+        return node or None
+    return copy.deepcopy(value)
+
+
+def _to_value(node):
+    """Converts a stored node back to what Firebase returns (dense integer keys become lists)."""
+    if not isinstance(node, dict):
+        return copy.deepcopy(node)
+    keys = list(node.keys())
+    if keys and all(k.isdigit() for k in keys):
+        indices = [int(k) for k in keys]
+        # Firebase returns an array when more than half of the keys up to the max are present
+        if max(indices) < 2 * len(indices):
+            result = [None] * (max(indices) + 1)
+            for k, child in node.items():
+                result[int(k)] = _to_value(child)
+            return result
+    return {k: _to_value(child) for k, child in node.items()}
+
+
+class InMemoryDatabase:
+    """Holds the whole tree in a nested dict guarded by a lock."""
+
+    def __init__(self, data=None):
+        self._root = _to_node(data) or {}
+        self._lock = threading.RLock()
+        self._push_counter = 0
+
+    def reference(self, path='/'):
+        return InMemoryReference(self, _split(path))
+
+    def _transaction(self):
+        """Context manager grouping the writes of one multi-path update."""
+        return self._lock
+
+    def _get(self, parts):
+        node = self._root
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _set(self, parts, value):
+        value = _to_node(value)
+        if not parts:
+            self._root = value or {}
+            return
+        node = self._root
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = {}
+                node[part] = child
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+
+class InMemoryReference:
+    def __init__(self, database, parts):
+        self._db = database
+        self._parts = parts
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    @property
+    def path(self):
+        return '/' + '/'.join(self._parts)
+
+    def child(self, path):
+        return InMemoryReference(self._db, self._parts + _split(path))
+
+    def get(self, shallow=False):
+        """shallow=True returns only the child keys (True for non-leaf children), like Firebase."""
+        with self._db._lock:
+            node = self._db._get(self._parts)
+            if shallow and isinstance(node, dict):
+                return {key: True if isinstance(child, dict) else copy.deepcopy(child) for key, child in node.items()}
+            return _to_value(node)
+
+    def set(self, value):
+        with self._db._lock:
+            self._db._set(self._parts, value)
+
+    def update(self, value):
+        """Multi-path update: every key is a path relative to this reference."""
+        with self._db._transaction():
+            for path, child in value.items():
+                self._db._set(self._parts + _split(path), child)
+
+    def delete(self):
+        self.set(None)
+
+    def push(self, value=''):
+        with self._db._lock:
+            self._db._push_counter += 1
+            key = f"{time.time_ns():020d}{self._db._push_counter:06d}"
+            ref = self.child(key)
+            ref.set(value)
+            return ref
+
+    def order_by_child(self, path):
+        return InMemoryQuery(self, path)
+
+
+class InMemoryQuery:
+    def __init__(self, reference, order_by):
+        self._ref = reference
+        self._order_by = _split(order_by)
+        self._start = None
+        self._end = None
+        self._limit_first = None
+        self._limit_last = None
+
+    def start_at(self, value):
+        self._start = value
+        return self
+
+    def end_at(self, value):
+        self._end = value
+        return self
+
+    def equal_to(self, value):
+        self._start = self._end = value
+        return self
+
+    def limit_to_first(self, limit):
+        self._limit_first = limit
+        return self
+
+    def limit_to_last(self, limit):
+        self._limit_last = limit
+        return self
+
+    def get(self):
+        with self._ref._db._lock:
+            node = self._ref._db._get(self._ref._parts) or {}
+            if not isinstance(node, dict):
+                return OrderedDict()
+            matches = []
+            for key, child in node.items():
+                value = child
+                for part in self._order_by:
+                    value = value.get(part) if isinstance(value, dict) else None
+                # Children without the ordering value never match a range
+                if value is None:
+                    continue
+                if self._start is not None and value < self._start:
+                    continue
+                if self._end is not None and value > self._end:
+                    continue
+                matches.append((value, key, child))
+            matches.sort(key=lambda m: (m[0], m[1]))
+            if self._limit_first is not None:
+                matches = matches[:self._limit_first]
+            if self._limit_last is not None:
+                matches = matches[-self._limit_last:]
+            return OrderedDict((key, _to_value(child)) for _, key, child in matches)
@@ -1,13 +1,20 @@
 
 import firebase_admin
-from firebase_admin import credentials, db
+from firebase_admin import credentials
 import pandas as pd
 import numpy as np
 import os
-import streamlit as st
+import time
+
+from catalog_snapshot import CATALOG_VERSION_PATH, new_catalog_version
+from catalog_sync import DELETED, PRODUCTS_COUNT_PATH, RATINGS_PATH, SERVER_TIMESTAMP, UPDATED_AT, rating_key, stamp_records
+from storage import get_database, is_firebase_backend
 
 # Setup credentials (reusing logic from firebase_utils)
 def init_firebase():
+    # A local storage backend (STORAGE_BACKEND=sqlite/memory) needs no Firebase app
+    if not is_firebase_backend():
+        return True
     if not firebase_admin._apps:
         if os.path.exists('serviceAccountKey.json'):
             cred = credentials.Certificate('serviceAccountKey.json')
@@ -19,138 +26,172 @@ def init_firebase():
             return False
     return True
 
-def migrate_ids():
+def id_keys(ids):
+    """
+    Typeless string keys for product IDs (Series): 17, 17.0 and '17' all become '17'.
+    Wishlists store IDs as strings or ints, so both sides of the lookup use these keys.
+    """
+    keys = ids.astype(str).str.strip()
+    numeric = pd.to_numeric(ids, errors='coerce')
+    integral = numeric.notna() & (numeric % 1 == 0)
+    keys[integral] = numeric[integral].astype('int64').astype(str)
+    return keys
+
+def build_id_mapping(df):
+    """
+    Assigns serial IDs 1..N to the unique products (Name + Brand, case/space-insensitive),
+    ordered by name. Returns (new ID per row as an array, {old ID key: new ID}, number of
+    old IDs that were used for more than one product).
+    """
+    # We clean Name/Brand to ensure better matching
+    name_clean = df['Name'].astype(str).str.strip().str.lower()
+    if 'Brand' in df.columns:
+        brand_clean = df['Brand'].astype(str).str.strip().str.lower()
+    else:
+        brand_clean = pd.Series('', index=df.index)
+
+    # One code per unique (Name, Brand), in order of first appearance
+    codes, uniques = pd.factorize(pd.MultiIndex.from_arrays([name_clean, brand_clean]))
+    # Sort for clean 1..N order (by name; ties keep first appearance)
+    order = np.argsort(uniques.get_level_values(0).to_numpy(dtype=object), kind='stable')
+    serial = np.empty(len(uniques), dtype=np.int64)
+    serial[order] = np.arange(1, len(uniques) + 1)
+    new_ids = serial[codes]
+
+    # Old -> New map for wishlists. If an old ID was used for several products
+    # (data inconsistency), the first product it appears with wins.
+    pairs = pd.DataFrame({'old': id_keys(df['ProdID']).to_numpy(), 'new': new_ids}).drop_duplicates()
+    conflicts = int(pairs['old'].duplicated().sum())
+    first = pairs.drop_duplicates('old')
+    old_to_new = dict(zip(first['old'].tolist(), first['new'].tolist()))
+    return new_ids, old_to_new, conflicts
+
+def remap_wishlists(users_data, old_to_new):
+    """
+    Rewrites every wishlist through old_to_new. Items without a product are dropped.
+    Returns ({'users/<uid>/wishlist': new list} for the changed users, remapped item count, dropped item count).
+    """
+    if isinstance(users_data, list):
+        users_data = {str(uid): udata for uid, udata in enumerate(users_data) if udata is not None}
+
+    updates = {}
+    remapped = dropped = 0
+    for uid, udata in (users_data or {}).items():
+        if not isinstance(udata, dict) or not isinstance(udata.get('wishlist'), list):
+            continue
+        old_list = udata['wishlist']
+        new_list = []
+        for key in id_keys(pd.Series(old_list, dtype=object)):
+            new_id = old_to_new.get(key)
+            if new_id is None:
+                # If ID doesn't exist in new map, it was a ghost product. Drop it.
+                print(f"Warning: User {uid} has item {key} not found in product list.")
+                dropped += 1
+            else:
+                new_list.append(new_id)
+                remapped += 1
+        if new_list != old_list:
+            updates[f"users/{uid}/wishlist"] = new_list
+    return updates, remapped, dropped
+
+def remap_ratings(ratings_data, old_to_new):
+    """
+    Moves the app's stored ratings (/ratings) to the new product IDs; ratings of products
+    that no longer exist are tombstoned. Returns {'ratings/<key>': record or tombstone}.
+    """
+    tombstone = {DELETED: True, UPDATED_AT: dict(SERVER_TIMESTAMP)}
+    moved, removed = {}, set()
+    for key, record in (ratings_data or {}).items():
+        if not isinstance(record, dict) or record.get(DELETED):
+            continue
+        new_id = old_to_new.get(id_keys(pd.Series([record.get('ProdID')], dtype=object))[0])
+        new_key = rating_key(record.get('ID'), new_id) if new_id is not None else None
+        if new_key != key:
+            removed.add(key)
+        if new_id is not None and new_id != record.get('ProdID'):
+            moved[new_key] = dict(record, ProdID=int(new_id), **{UPDATED_AT: dict(SERVER_TIMESTAMP)})
+    # A key that is both vacated and written to (IDs swapped) keeps the new record
+    updates = {f"{RATINGS_PATH.strip('/')}/{key}": tombstone for key in removed - set(moved)}
+    updates.update({f"{RATINGS_PATH.strip('/')}/{key}": record for key, record in moved.items()})
+    return updates
+
+def migrate_ids(dry_run=False):
+    """
+    Renumbers products to serial IDs and rewrites the wishlists to match, in a single
+    multi-path update of the database root. With dry_run=True only the mapping stats are printed.
+    """
     if not init_firebase():
         return
 
+    started = time.perf_counter()
+    database = get_database()
+
     print("Fetching data...")
-    ref_products = db.reference('/products')
-    data = ref_products.get()
-    
+    data = database.reference('/products').get()
+
     if not data:
         print("No product data found.")
         return
 
-    # Convert to DataFrame
+    # Convert to DataFrame. Firebase returns a list for dense index keys and a dict otherwise
     if isinstance(data, list):
-        data = [x for x in data if x is not None]
-        df = pd.DataFrame(data)
-    else:
-        print("Data format not recognized (expected list).")
+        data = {str(i): x for i, x in enumerate(data)}
+    if not isinstance(data, dict):
+        print("Data format not recognized (expected list or dict).")
         return
+    previous_keys = set(data)
+    # Index keys in order, then any other keys
+    keys = sorted(data, key=lambda k: (0, int(k), '') if str(k).isdigit() else (1, 0, str(k)))
+    df = pd.DataFrame([data[k] for k in keys if isinstance(data[k], dict) and not data[k].get(DELETED)])
+    df = df.drop(columns=[UPDATED_AT, DELETED], errors='ignore')
 
     print(f"Original records: {len(df)}")
-    
+
     # Check if 'Name' exists
-    if 'Name' not in df.columns:
+    if df.empty or 'Name' not in df.columns:
         print("Column 'Name' not found. Cannot deduplicate.")
         return
 
-    # 1. Create a Mapping: Unique Product (Name + Brand) -> New Serial ID
-    # We clean Name/Brand to ensure better matching
-    df['Name_Clean'] = df['Name'].astype(str).str.strip().str.lower()
-    df['Brand_Clean'] = df['Brand'].astype(str).str.strip().str.lower() if 'Brand' in df.columns else ''
-    
-    # Identify unique products
-    unique_products = df.drop_duplicates(subset=['Name_Clean', 'Brand_Clean'])
-    unique_products = unique_products.sort_values(by=['Name_Clean']) # Sort for clean 1..N order
-    
-    # Assign New IDs
-    unique_products['New_ProdID'] = range(1, len(unique_products) + 1)
-    
-    # Create mapping dictionary
-    # Map (Name_Clean, Brand_Clean) -> New_ProdID
-    # Also Map Old_ProdID -> New_ProdID (This is tricky if Old_ProdID 100 maps to Soap AND Shampoo - inconsistency. 
-    # But we map primarily by Name).
-    
-    # Let's map strict Name+Brand to ID
-    id_map = dict(zip(zip(unique_products['Name_Clean'], unique_products['Brand_Clean']), unique_products['New_ProdID']))
-    
-    # Also need OLD ID to NEW ID map for updating Wishlists
-    # Since multiple Old IDs might map to one New ID (consolidation), or one Old ID might split (if named differently),
-    # We have to be careful. Wishlist stores Old_ProdID.
-    # We need a fallback map: Old_ProdID -> Most common New_ProdID for that ID?
-    # Or iterate the original DF: For each row, we have Old ID and New ID.
-    
     print("Mapping IDs...")
-    
-    # Apply New IDs to dataframe
-    def get_new_id(row):
-        n = str(row['Name']).strip().lower()
-        b = str(row['Brand']).strip().lower() if 'Brand' in row else ''
-        return id_map.get((n, b))
-
-    df['ProdID_New'] = df.apply(get_new_id, axis=1)
-    
-    # Generate Old -> New Map for Wishlists
-    # Logic: For each Old ID, find what New ID it corresponds to.
-    # If Old ID maps to multiple (data inconsistency), pick the most frequent one?
-    old_to_new_map = {}
-    
-    # We iterate unique pairs of (ProdID, ProdID_New) in the DF
-    mapping_df = df[['ProdID', 'ProdID_New']].drop_duplicates()
-    
-    # Check for conflicts
-    # If an Old ProdID maps to multiple New ProdIDs (meaning Old ID 100 was used for both "Soap" and "Car"),
-    # we can't perfectly migrate wishlist without knowing which one they meant.
-    # We will assume Old IDs generally point to one product type.
-    
-    for _, row in mapping_df.iterrows():
-        old = row['ProdID']
-        new = row['ProdID_New']
-        if old not in old_to_new_map:
-            old_to_new_map[old] = new
-        else:
-            # Conflict! 
-            pass
-            
-    # Update Dataframe ProdID
-    df['ProdID'] = df['ProdID_New']
-    
-    # Clean up temp cols
-    final_df = df.drop(columns=['Name_Clean', 'Brand_Clean', 'ProdID_New', 'New_ProdID'], errors='ignore')
-    
-    print("Updating /products database...")
-    records = final_df.to_dict(orient='records')
-    ref_products.set(records)
-    print("Products updated.")
-    
-    # 2. Update Wishlists
-    print("Updating User Wishlists...")
-    ref_users = db.reference('/users')
-    users_data = ref_users.get()
-    
-    if users_data:
-        updated_count = 0
-        for uid, udata in users_data.items():
-            if 'wishlist' in udata and isinstance(udata['wishlist'], list):
-                old_list = udata['wishlist']
-                new_list = []
-                changed = False
-                for oid in old_list:
-                    # Wishlist items might be strings or ints
-                    # Try to match typeless
-                    matched = False
-                    for existing_old, mapped_new in old_to_new_map.items():
-                        if str(existing_old) == str(oid):
-                            new_list.append(mapped_new)
-                            matched = True
-                            break
-                    if not matched:
-                        # Keep it if we can't map it? Or drop?
-                        # If ID doesn't exist in new map, it was a ghost product. Drop it.
-                        print(f"Warning: User {uid} has item {oid} not found in product list.")
-                        changed = True # It's changed because we're dropping it
-                    
-                if new_list != old_list:
-                    ref_users.child(uid).child('wishlist').set(new_list)
-                    updated_count += 1
-        
-        print(f"Updated wishlists for {updated_count} users.")
-    else:
-        print("No users found.")
+    new_ids, old_to_new, conflicts = build_id_mapping(df)
+    changed_records = int((id_keys(df['ProdID']).to_numpy() != new_ids.astype(str)).sum())
+    df['ProdID'] = new_ids
+
+    print("Mapping User Wishlists...")
+    wishlist_updates, remapped, dropped = remap_wishlists(database.reference('/users').get(), old_to_new)
+    rating_updates = remap_ratings(database.reference(RATINGS_PATH).get(), old_to_new)
+
+    print(f"Unique products: {int(new_ids.max())} (from {len(old_to_new)} old IDs)")
+    print(f"Old IDs used for more than one product: {conflicts}")
+    print(f"Records with a new ProdID: {changed_records} of {len(df)}")
+    print(f"Wishlist items remapped: {remapped}, dropped: {dropped}, users updated: {len(wishlist_updates)}")
+    print(f"Stored ratings rewritten: {len(rating_updates)}")
+
+    if dry_run:
+        print(f"Dry run, nothing written ({time.perf_counter() - started:.2f}s).")
+        return
+
+    # One multi-path update: products, wishlists and the catalog version change together
+    records = stamp_records(df.to_dict(orient='records'))
+    products = {str(i): record for i, record in enumerate(records)}
+    # Tombstone keys the new list doesn't use (trailing keys of a longer previous list, other
+    # keys) so incremental readers drop them
+    # (inside the products value: multi-path updates can't contain overlapping paths)
+    for key in previous_keys - set(products):
+        products[key] = {DELETED: True, UPDATED_AT: dict(SERVER_TIMESTAMP)}
+    update = {'products': products}
+    update.update(wishlist_updates)
+    update.update(rating_updates)
+    update[PRODUCTS_COUNT_PATH.strip('/')] = len(records)
+    update[CATALOG_VERSION_PATH.strip('/')] = new_catalog_version()
 
-    print("Migration Complete.")
+    print("Updating database...")
+    database.reference('/').update(update)
+    print(f"Migration Complete ({time.perf_counter() - started:.2f}s).")
 
 if __name__ == "__main__":
-    migrate_ids()
+    import argparse
+    parser = argparse.ArgumentParser(description="Renumber products to serial IDs and remap user wishlists.")
+    parser.add_argument('--dry-run', action='store_true', help="Only report the mapping stats, write nothing")
+    args = parser.parse_args()
+    migrate_ids(dry_run=args.dry_run)
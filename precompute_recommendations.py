@@ -0,0 +1,194 @@
+"""
+Precomputed "Recommended for You" table.
+
+Offline job (run next to main.py):
+
+    python precompute_recommendations.py --shards 8 --workers 4 --top-n 20
+
+splits the users into contiguous ID ranges (shards), scores each shard with the batch
+recommender in a process pool, and writes one table keyed by user:
+
+    user_ids     (users,)          int64, sorted
+    product_ids  (users, top_n)    int32, best first, padded with -1
+    scores       (users, top_n)    float32
+    version / engine / top_n
+
+The app serves the home page from the table with precomputed_recommendations(); users
+missing from it (new sign-ups, stale table, ratings applied since) get the live recommender;
+a table built by another engine than the one asked for is stale too.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from als_recommender import als_recommendations, batch_als_recommendations, get_als_model
+from catalog_cache import cached_build, catalog_version
+from catalog_index import get_catalog_index
+from collaborative_based_filtering import batch_collaborative_filtering_recommendations, collaborative_filtering_recommendations
+from interaction_matrix import INTERACTION_COLUMNS, get_interaction_matrix
+
+DEFAULT_TABLE_PATH = 'user_recommendations.npz'
+DEFAULT_TOP_N = 20
+
+ENGINES = {
+    'cosine': (collaborative_filtering_recommendations, batch_collaborative_filtering_recommendations),
+    'als': (als_recommendations, batch_als_recommendations),
+}
+
+
+class RecommendationTable:
+    """Top-N recommendations per user, looked up by binary search on the sorted user IDs."""
+
+    def __init__(self, user_ids, product_ids, scores, version='', engine='cosine'):
+        self.user_ids = np.asarray(user_ids)
+        self.product_ids = product_ids
+        self.scores = scores
+        self.version = version
+        self.engine = engine
+
+    @property
+    def top_n(self):
+        return self.product_ids.shape[1]
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def recommendations(self, user_id, top_n=None):
+        """(ProdIDs, scores) of the user, best first, or None if the user is not in the table."""
+        pos = np.searchsorted(self.user_ids, user_id)
+        if pos >= len(self.user_ids) or self.user_ids[pos] != user_id:
+            return None
+        product_ids = self.product_ids[pos, :top_n]
+        valid = product_ids >= 0
+        return product_ids[valid], self.scores[pos, :top_n][valid]
+
+    def save(self, path=DEFAULT_TABLE_PATH):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, user_ids=self.user_ids, product_ids=self.product_ids, scores=self.scores,
+                     version=np.array(self.version), engine=np.array(self.engine))
+        os.replace(tmp_path, path)
+
+
+def load_recommendation_table(path=DEFAULT_TABLE_PATH):
+    """Loads a table written by RecommendationTable.save(), or returns None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        return RecommendationTable(f['user_ids'], f['product_ids'], f['scores'],
+                                   str(f['version']), str(f['engine']))
+
+
+def get_recommendation_table(data, path=DEFAULT_TABLE_PATH):
+    """The precomputed table if it was built from this catalog version, else None."""
+    def load_current(data):
+        table = load_recommendation_table(path)
+        if table is not None and table.version == catalog_version(data, INTERACTION_COLUMNS):
+            return table
+        return None
+
+    # Keyed by the file's mtime too, so a table written while the app runs is picked up
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    return cached_build(f"recommendation_table/{path}/{mtime}", data, INTERACTION_COLUMNS, load_current)
+
+
+def precomputed_recommendations(data, target_user_id, top_n=10, path=DEFAULT_TABLE_PATH, engine='cosine'):
+    """
+    Same result as the live `engine` recommender ('cosine' or 'als'), read from the table.
+    Falls back to the live recommender for users not in it, when the table is older than
+    the catalog or was built by another engine, asks for fewer items than top_n, or the
+    user rated something since.
+    """
+    live, _ = ENGINES[engine]
+    table = get_recommendation_table(data, path)
+    if table is None or table.engine != engine or table.top_n < top_n:
+        return live(data, target_user_id, top_n=top_n)
+
+    interactions = get_interaction_matrix(data)
+    user_code = interactions.user_code(target_user_id)
+    found = table.recommendations(target_user_id, top_n)
+    if found is None or (user_code is not None and interactions.is_updated(user_code)):
+        return live(data, target_user_id, top_n=top_n)
+
+    product_ids, scores = found
+    if len(product_ids) == 0:
+        return pd.DataFrame()
+    recommended_items_details, kept = get_catalog_index(data).take(product_ids, ['ProdID', 'Name', 'ImageURL', 'Brand', 'Rating', 'ReviewCount'], return_mask=True)
+    return recommended_items_details.assign(Score=scores[kept])
+
+
+# Catalog (and trained ALS model, if any) of the worker process, set once by the pool initializer
+_worker_data = None
+_worker_model = None
+
+
+def _init_worker(data, model):
+    global _worker_data, _worker_model
+    _worker_data, _worker_model = data, model
+
+
+def _compute_shard(engine, user_ids, top_n, block_size):
+    started = time.perf_counter()
+    if _worker_model is not None:
+        # Score with the model trained once in the parent instead of retraining per worker
+        items, scores = _worker_model.recommend_batch(user_ids, top_n, block_size)
+        product_ids = np.where(items >= 0, _worker_model.interactions.item_ids[items], -1)
+    else:
+        _, batch = ENGINES[engine]
+        product_ids, scores = batch(_worker_data, user_ids, top_n=top_n, block_size=block_size)
+    return user_ids, product_ids.astype(np.int32), scores, time.perf_counter() - started
+
+
+def precompute_recommendation_table(data, engine='cosine', top_n=DEFAULT_TOP_N, shards=8,
+                                    workers=None, block_size=256) -> RecommendationTable:
+    """Computes the table for every user with ratings, one shard (contiguous ID range) per task."""
+    user_ids = get_interaction_matrix(data).user_ids  # sorted
+    shard_ids = [ids for ids in np.array_split(user_ids, max(1, shards)) if len(ids)]
+
+    model = get_als_model(data) if engine == 'als' else None
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data, model)) as pool:
+        futures = [pool.submit(_compute_shard, engine, ids, top_n, block_size) for ids in shard_ids]
+        for future in as_completed(futures):
+            ids, product_ids, scores, elapsed = future.result()
+            print(f"  users {ids[0]}..{ids[-1]} ({len(ids)}) in {elapsed:.2f}s")
+            results.append((ids, product_ids, scores))
+
+    results.sort(key=lambda result: result[0][0])
+    return RecommendationTable(
+        np.concatenate([r[0] for r in results]) if results else user_ids[:0],
+        np.concatenate([r[1] for r in results]) if results else np.empty((0, top_n), dtype=np.int32),
+        np.concatenate([r[2] for r in results]) if results else np.empty((0, top_n), dtype=np.float32),
+        version=catalog_version(data, INTERACTION_COLUMNS), engine=engine)
+
+
+if __name__ == "__main__":
+    import argparse
+    from firebase_utils import get_data_from_firebase
+    from preprocess_data import process_data
+
+    parser = argparse.ArgumentParser(description="Precompute top-N recommendations for every user.")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='cosine')
+    parser.add_argument('--top-n', type=int, default=DEFAULT_TOP_N)
+    parser.add_argument('--shards', type=int, default=8, help="Number of user ID ranges")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--block-size', type=int, default=256, help="Users scored per matrix product")
+    parser.add_argument('--output', default=DEFAULT_TABLE_PATH)
+    args = parser.parse_args()
+
+    raw_data = get_data_from_firebase()
+    if raw_data is None:
+        print("Failed to load data")
+        exit()
+    data = process_data(raw_data)
+
+    start = time.perf_counter()
+    table = precompute_recommendation_table(data, args.engine, args.top_n, args.shards, args.workers, args.block_size)
+    table.save(args.output)
+    size_mb = os.path.getsize(args.output) / 1e6
+    print(f"Precomputed {args.top_n} {args.engine} recommendations for {len(table)} users "
+          f"in {time.perf_counter() - start:.2f}s -> {args.output} ({size_mb:.1f} MB)")
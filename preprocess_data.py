@@ -2,37 +2,153 @@
 import pandas as pd
 import numpy as np
 
+from catalog_cache import catalog_version
 
+PRODUCT_COLUMNS = ['ProdID', 'Name', 'Brand', 'Category', 'ImageURL', 'ReviewCount', 'Description', 'Tags']
 
-def process_data(data: pd.DataFrame) -> pd.DataFrame:
-    # Replace invalid values with NaN
-    data['ProdID'] = data['ProdID'].replace(-2147483648, np.nan)
-    data['ID'] = data['ID'].replace(-2147483648, np.nan)
 
-    # Convert ID to numeric and clean
-    data['ID'] = pd.to_numeric(data['ID'], errors='coerce')
-    data = data.dropna(subset=['ID'])
+class NormalizedCatalog:
+    """
+    The catalog split into a products table (one row per ProdID, Rating = mean rating)
+    and an integer-coded interactions table (user_code, item_code, Rating as float32).
+    item_code is the row of the product in `products`; user_ids[user_code] is the user's ID.
+    The recommenders accept this in place of the one-row-per-rating DataFrame.
+    """
+    def __init__(self, products: pd.DataFrame, interactions: pd.DataFrame, user_ids):
+        self.products = products
+        self.interactions = interactions
+        self.user_ids = np.asarray(user_ids)
+        self._version = None
 
-    # Clean ProdID
-    data = data.dropna(subset=['ProdID'])
-    
-    # Remove rows where ID or ProdID is 0
-    data = data[(data['ID'] != 0) & (data['ProdID'] != 0)].copy()
+    @property
+    def version(self):
+        """Catalog fingerprint used to key the recommenders' cached models."""
+        if self._version is None:
+            self._version = (catalog_version(self.products, self.products.columns) + '/' +
+                             catalog_version(self.interactions, self.interactions.columns))
+        return self._version
 
-    data['ID'] = data['ID'].astype('int64')
-    data['ProdID'] = data['ProdID'].astype('int64')
 
-    # ReviewCount
-    data['ReviewCount'] = pd.to_numeric(
-        data['ReviewCount'], errors='coerce'
-    ).fillna(0).astype('int64')
+def normalize_catalog(data: pd.DataFrame) -> NormalizedCatalog:
+    """Builds a NormalizedCatalog from the processed one-row-per-rating DataFrame."""
+    columns = [c for c in PRODUCT_COLUMNS if c in data.columns]
+    products = data.drop_duplicates(subset=['ProdID'])[columns].sort_values('ProdID').reset_index(drop=True)
+    for col in ['Brand', 'Category']:
+        if col in products.columns:
+            products[col] = products[col].astype('category')
 
-    # Drop unwanted column if exists
-    if 'Unnamed: 0' in data.columns:
-        data = data.drop(columns=['Unnamed: 0'])
+    ratings = pd.to_numeric(data['Rating'], errors='coerce').to_numpy(dtype=np.float32)
+    rated = ~np.isnan(ratings)
+    item_codes = pd.Index(products['ProdID']).get_indexer(data['ProdID'])[rated].astype(np.int32)
+    user_codes, user_ids = pd.factorize(data['ID'].to_numpy()[rated], sort=True)
+    interactions = pd.DataFrame({
+        'user_code': user_codes.astype(np.int32),
+        'item_code': item_codes,
+        'Rating': ratings[rated],
+    })
 
-    # Fill text columns
-    for col in ['Category', 'Brand', 'Description', 'Tags']:
-        data[col] = data[col].fillna('')
+    # Product-level mean rating, as get_top_rated_items computes it
+    n_products = len(products)
+    rating_sums = np.bincount(item_codes, weights=ratings[rated], minlength=n_products)
+    rating_counts = np.bincount(item_codes, minlength=n_products)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        products['Rating'] = (rating_sums / rating_counts).astype(np.float32)
+    return NormalizedCatalog(products, interactions, user_ids)
 
+
+def _string_dtype():
+    """Arrow-backed strings when pyarrow is available (it ships with streamlit), else pandas strings."""
+    try:
+        import pyarrow  # noqa: F401
+        return 'string[pyarrow]'
+    except ImportError:
+        return 'string'
+
+
+# Column -> dtype of the processed catalog. Columns not listed are passed through unchanged.
+CATALOG_SCHEMA = {
+    'ID': 'int32',
+    'ProdID': 'int32',
+    'Rating': 'float32',
+    'ReviewCount': 'int32',
+    'Price': 'float32',
+    'Brand': 'category',
+    'Category': 'category',
+    'Name': _string_dtype(),
+    'Tags': _string_dtype(),
+    'Description': _string_dtype(),
+    'ImageURL': _string_dtype(),
+}
+
+# Sentinel written for missing integers in the source data
+INVALID_ID = -2147483648
+
+
+def process_data(data: pd.DataFrame, normalize: bool = False):
+    """
+    Cleans the raw catalog (one row per rating) in a single pass and applies CATALOG_SCHEMA.
+    With normalize=True, returns a NormalizedCatalog instead of the DataFrame.
+    """
+    ids = pd.to_numeric(data['ID'], errors='coerce')
+    prod_ids = pd.to_numeric(data['ProdID'], errors='coerce')
+
+    # Drop rows with a missing, invalid or 0 ID / ProdID
+    keep = (ids.notna() & prod_ids.notna() &
+            (ids != 0) & (prod_ids != 0) &
+            (ids != INVALID_ID) & (prod_ids != INVALID_ID)).to_numpy()
+
+    # Build each column once, already filtered and in its final dtype
+    columns = {}
+    for col in data.columns:
+        if col == 'Unnamed: 0':
+            continue
+        if col == 'ID':
+            values = ids[keep]
+        elif col == 'ProdID':
+            values = prod_ids[keep]
+        else:
+            values = data[col][keep]
+
+        if col in ('Rating', 'Price'):
+            values = pd.to_numeric(values, errors='coerce')
+        elif col == 'ReviewCount':
+            values = pd.to_numeric(values, errors='coerce').fillna(0)
+        elif col in ('Category', 'Brand', 'Description', 'Tags', 'ImageURL'):
+            values = values.fillna('')
+
+        dtype = CATALOG_SCHEMA.get(col)
+        columns[col] = values.astype(dtype) if dtype is not None else values
+
+    data = pd.DataFrame(columns)
+    # Row labels of the raw data carry no meaning; a RangeIndex costs no memory
+    data.index = pd.RangeIndex(len(data))
+
+    if normalize:
+        return normalize_catalog(data)
     return data
+
+
+def memory_report(data: pd.DataFrame) -> pd.Series:
+    """Deep memory usage per column in MB, with a 'Total' entry."""
+    usage = data.memory_usage(deep=True, index=True) / 1e6
+    usage['Total'] = usage.sum()
+    return usage.round(3)
+
+
+if __name__ == "__main__":
+    import time
+    from firebase_utils import get_data_from_firebase
+
+    raw_data = get_data_from_firebase()
+    if raw_data is None:
+        print("Failed to load data")
+        exit()
+
+    start = time.perf_counter()
+    data = process_data(raw_data)
+    elapsed = time.perf_counter() - start
+
+    report = pd.DataFrame({'raw_MB': memory_report(raw_data), 'processed_MB': memory_report(data)})
+    print(report)
+    print(f"Cleaned {len(raw_data)} -> {len(data)} rows in {elapsed * 1000:.1f} ms, "
+          f"{report.loc['Total', 'raw_MB'] / report.loc['Total', 'processed_MB']:.1f}x smaller")
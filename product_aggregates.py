@@ -0,0 +1,166 @@
+import threading
+from bisect import bisect_left, insort
+
+import numpy as np
+import pandas as pd
+
+from catalog_cache import pinned_build
+from catalog_index import PRODUCT_COLUMNS, get_catalog_index
+
+# Columns get_top_rated_items returns (Rating is the product's mean rating)
+TOP_RATED_COLUMNS = ('ProdID', 'Name', 'ReviewCount', 'Brand', 'ImageURL', 'Rating')
+
+
+# Entries per block of a ranking; blocks are split when they grow past twice this
+RANKING_BLOCK_SIZE = 512
+
+
+class _Ranking:
+    """
+    Product positions kept sorted by descending score (ties by ProdID); unrated products last.
+    The sorted entries are split into blocks of at most 2 * RANKING_BLOCK_SIZE, so moving a
+    product costs a bisect over the block maxima plus one block shift, not a shift of the whole list.
+    """
+
+    def __init__(self, scores, product_ids):
+        keys = np.where(np.isnan(scores), np.inf, -scores.astype(np.float64))
+        self._keys = keys.tolist()
+        self._ids = product_ids.tolist()
+        order = np.lexsort((product_ids, keys))
+        entries = list(zip(keys[order].tolist(), product_ids[order].tolist(), order.tolist()))
+        self._blocks = [entries[i:i + RANKING_BLOCK_SIZE] for i in range(0, len(entries), RANKING_BLOCK_SIZE)]
+        # Last (largest) entry of each block
+        self._maxes = [block[-1] for block in self._blocks]
+
+    def update(self, position, score):
+        self._remove((self._keys[position], self._ids[position], position))
+        key = np.inf if np.isnan(score) else -float(score)
+        self._keys[position] = key
+        self._insert((key, self._ids[position], position))
+
+    def _remove(self, entry):
+        i = bisect_left(self._maxes, entry)
+        block = self._blocks[i]
+        del block[bisect_left(block, entry)]
+        if block:
+            self._maxes[i] = block[-1]
+        else:
+            del self._blocks[i], self._maxes[i]
+
+    def _insert(self, entry):
+        if not self._blocks:
+            self._blocks, self._maxes = [[entry]], [entry]
+            return
+        i = min(bisect_left(self._maxes, entry), len(self._blocks) - 1)
+        block = self._blocks[i]
+        insort(block, entry)
+        self._maxes[i] = block[-1]
+        if len(block) > 2 * RANKING_BLOCK_SIZE:
+            self._blocks[i:i + 1] = [block[:RANKING_BLOCK_SIZE], block[RANKING_BLOCK_SIZE:]]
+            self._maxes[i:i + 1] = [block[RANKING_BLOCK_SIZE - 1], block[-1]]
+
+    def top(self, top_n):
+        positions = []
+        for block in self._blocks:
+            if len(positions) >= top_n:
+                break
+            positions.extend(position for _, _, position in block[:top_n - len(positions)])
+        return positions
+
+
+class ProductAggregates:
+    """
+    Per-product rating aggregates (rows aligned with the catalog index):
+    rating sum and count, mean rating, review count and a Bayesian-smoothed score
+
+        BayesianScore = (prior_count * prior_mean + rating_sum) / (prior_count + rating_count)
+
+    which pulls products with few ratings towards the catalog-wide mean. Top-N lists are
+    served from rankings kept sorted as ratings are added, so they cost O(top_n).
+    prior_mean / prior_count are fixed when the table is built.
+    """
+
+    def __init__(self, catalog, rating_sum, rating_count):
+        self.catalog = catalog
+        self.rating_sum = rating_sum.astype(np.float64)
+        self.rating_count = rating_count.astype(np.int64)
+        rated = self.rating_count > 0
+        total = self.rating_count.sum()
+        self.prior_mean = float(self.rating_sum.sum() / total) if total else 0.0
+        self.prior_count = float(self.rating_count[rated].mean()) if rated.any() else 1.0
+        product_ids = catalog.product_ids
+        self._rankings = {'Rating': _Ranking(self.mean_rating(), product_ids),
+                          'BayesianScore': _Ranking(self.bayesian_score(), product_ids)}
+        self._lock = threading.Lock()
+
+    def mean_rating(self, positions=slice(None)):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.rating_sum[positions] / self.rating_count[positions]
+
+    def bayesian_score(self, positions=slice(None)):
+        return ((self.prior_count * self.prior_mean + self.rating_sum[positions]) /
+                (self.prior_count + self.rating_count[positions]))
+
+    def table(self) -> pd.DataFrame:
+        """The aggregates as a DataFrame (one row per product)."""
+        products = self.catalog.products
+        return pd.DataFrame({
+            'ProdID': products['ProdID'].to_numpy(),
+            'Rating': self.mean_rating().astype(np.float32),
+            'RatingCount': self.rating_count,
+            'ReviewCount': products['ReviewCount'].to_numpy() if 'ReviewCount' in products else 0,
+            'BayesianScore': self.bayesian_score().astype(np.float32),
+        })
+
+    def add_rating(self, product_id, rating, previous_rating=None):
+        """
+        Applies one new rating (or a changed one, given the rating it replaces).
+        Returns False for a product not in the catalog (picked up at the next rebuild).
+        """
+        position = self.catalog.position_of_product(product_id)
+        if position is None:
+            return False
+        with self._lock:
+            if previous_rating is None:
+                self.rating_count[position] += 1
+                self.rating_sum[position] += rating
+            else:
+                self.rating_sum[position] += rating - previous_rating
+            self._rankings['Rating'].update(position, self.mean_rating(position))
+            self._rankings['BayesianScore'].update(position, self.bayesian_score(position))
+        return True
+
+    def top_positions(self, top_n, by='Rating'):
+        with self._lock:
+            return self._rankings[by].top(top_n)
+
+    def top_rated(self, top_n=10, by='Rating') -> pd.DataFrame:
+        """Top N products by mean rating (or by='BayesianScore'), with their details."""
+        positions = self.top_positions(top_n, by)
+        products = self.catalog.products
+        columns = [c for c in TOP_RATED_COLUMNS if c in products.columns]
+        top = products.take(positions)[columns].reset_index(drop=True)
+        top['Rating'] = self.mean_rating(positions)
+        if by != 'Rating':
+            top[by] = self.bayesian_score(positions)
+        return top
+
+
+def build_product_aggregates(data) -> ProductAggregates:
+    catalog = get_catalog_index(data)
+    if not isinstance(data, pd.DataFrame):
+        # NormalizedCatalog: item_code is already the product's row
+        positions = data.interactions['item_code'].to_numpy()
+        ratings = data.interactions['Rating'].to_numpy(dtype=np.float64)
+    else:
+        positions = catalog.positions(data['ProdID'])
+        ratings = pd.to_numeric(data['Rating'], errors='coerce').to_numpy(dtype=np.float64)
+    rated = (positions >= 0) & ~np.isnan(ratings)
+    rating_sum = np.bincount(positions[rated], weights=ratings[rated], minlength=len(catalog))
+    rating_count = np.bincount(positions[rated], minlength=len(catalog))
+    return ProductAggregates(catalog, rating_sum, rating_count)
+
+
+def get_product_aggregates(data) -> ProductAggregates:
+    """Returns the aggregates table, built once per catalog version (pinned: add_rating updates it in place)."""
+    return pinned_build('product_aggregates', data, PRODUCT_COLUMNS, build_product_aggregates)
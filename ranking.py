@@ -0,0 +1,56 @@
+import numpy as np
+
+
+def top_n_indices(scores, top_n):
+    """
+    Returns the positions of the `top_n` highest finite scores, best first; equal scores
+    are ordered by position. Uses argpartition so only the selected entries are sorted.
+    """
+    scores = np.asarray(scores)
+    candidates = np.flatnonzero(np.isfinite(scores))
+    if top_n <= 0 or len(candidates) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if top_n < len(candidates):
+        values = scores[candidates]
+        kth = values[np.argpartition(-values, top_n - 1)[top_n - 1]]
+        # Everything above the cut, then the lowest positions among the scores tied at it
+        above = values > kth
+        tied = np.flatnonzero(values == kth)[:top_n - np.count_nonzero(above)]
+        above[tied] = True
+        candidates = candidates[above]
+    order = np.argsort(-scores[candidates], kind='stable')
+    return candidates[order]
+
+
+def top_n_indices_2d(scores, top_n):
+    """
+    Row-wise top_n_indices for a 2-D score block: returns (positions, values), both
+    (rows x top_n), best first, ties ordered by position. Slots beyond a row's finite
+    scores hold -1 / -inf.
+    """
+    scores = np.asarray(scores)
+    n_rows, n_cols = scores.shape
+    top_n = min(top_n, n_cols)
+    if top_n <= 0:
+        return np.empty((n_rows, 0), dtype=np.int64), np.empty((n_rows, 0), dtype=scores.dtype)
+
+    if top_n < n_cols:
+        partitioned = np.argpartition(-scores, top_n - 1, axis=1)[:, top_n - 1:top_n]
+        kth = np.take_along_axis(scores, partitioned, axis=1)
+        # Per row: everything above the cut, then the lowest positions among the ties at it
+        above = scores > kth
+        tied = scores == kth
+        needed = top_n - above.sum(axis=1, keepdims=True)
+        selected = above | (tied & (np.cumsum(tied, axis=1) <= needed))
+        positions = np.nonzero(selected)[1].reshape(n_rows, top_n)
+    else:
+        positions = np.broadcast_to(np.arange(n_cols), (n_rows, n_cols))
+    values = np.take_along_axis(scores, positions, axis=1)
+    order = np.argsort(-values, axis=1, kind='stable')
+    positions = np.take_along_axis(positions, order, axis=1)
+    values = np.take_along_axis(values, order, axis=1)
+    missing = ~np.isfinite(values)
+    positions = np.where(missing, -1, positions)
+    values = np.where(missing, -np.inf, values)
+    return positions, values
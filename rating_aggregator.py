@@ -0,0 +1,104 @@
+"""
+Applies new ratings to the structures cached for the loaded catalog, so rating-driven
+sections (Top Rated, Recommended for You) reflect a rating immediately instead of after
+the next catalog reload and reprocessing.
+
+    apply_rating(data, user_id, product_id, rating)
+
+updates, in O(1) plus the cost of re-ranking one product:
+  - the product's running rating sum/count and its place in the top-rated rankings (product_aggregates)
+  - the user's running rating sum/count (RatingAggregator)
+  - the user's row of the interaction matrix (interaction_matrix.InteractionMatrix.set_rating)
+
+Changes live in memory for the current catalog version (pinned in catalog_cache, so they
+are not lost to cache evictions). The app calls it when a signed-in user rates a product
+on its detail page, next to storing the rating under /ratings
+(firebase_utils.save_rating_to_firebase); stored ratings are not part of /products, so
+apply_ratings() applies them again on top of every catalog the app loads.
+"""
+import threading
+
+import numpy as np
+
+from catalog_cache import pinned_build
+from catalog_index import PRODUCT_COLUMNS
+from interaction_matrix import INTERACTION_COLUMNS, get_interaction_matrix
+from product_aggregates import get_product_aggregates
+
+AGGREGATOR_COLUMNS = tuple(dict.fromkeys(PRODUCT_COLUMNS + INTERACTION_COLUMNS))
+
+
+class RatingAggregator:
+    """Running per-user rating sums/counts, plus the product aggregates and interaction matrix they update."""
+
+    def __init__(self, products, interactions):
+        self.products = products
+        self.interactions = interactions
+        matrix = interactions.matrix
+        self.user_sum = np.asarray(matrix.sum(axis=1), dtype=np.float64).ravel()
+        self.user_count = np.diff(matrix.indptr).astype(np.int64)
+        # Ratings with no row (new user) or column (unrated product) in the matrix:
+        # (user_id, product_id) -> rating, kept until the next rebuild
+        self.unplaced = {}
+        self._lock = threading.Lock()
+
+    def apply(self, user_id, product_id, rating):
+        """Applies one rating (a repeated rating replaces the previous one). Returns the previous rating or None."""
+        rating = float(rating)
+        with self._lock:
+            user_code = self.interactions.user_code(user_id)
+            item_code = self.interactions.item_code(product_id)
+            if user_code is None or item_code is None:
+                previous = self.unplaced.get((user_id, product_id))
+                self.unplaced[(user_id, product_id)] = rating
+            else:
+                previous = self.interactions.set_rating(user_code, item_code, rating)
+            if user_code is not None:
+                self.user_sum[user_code] += rating - (previous or 0.0)
+                self.user_count[user_code] += previous is None
+        self.products.add_rating(product_id, rating, previous)
+        return previous
+
+    def unplaced_ratings(self, user_id):
+        """{product_id: rating} of the user's applied ratings that have no place in the matrix (e.g. a new user's)."""
+        with self._lock:
+            return {product_id: rating for (uid, product_id), rating in self.unplaced.items() if uid == user_id}
+
+    def user_mean(self, user_id):
+        """The user's mean rating, including ratings applied since the build (None if unrated)."""
+        user_code = self.interactions.user_code(user_id)
+        if user_code is not None:
+            return self.user_sum[user_code] / self.user_count[user_code] if self.user_count[user_code] else None
+        ratings = [r for (uid, _), r in self.unplaced.items() if uid == user_id]
+        return float(np.mean(ratings)) if ratings else None
+
+
+def build_rating_aggregator(data) -> RatingAggregator:
+    return RatingAggregator(get_product_aggregates(data), get_interaction_matrix(data))
+
+
+def get_rating_aggregator(data) -> RatingAggregator:
+    return pinned_build('rating_aggregator', data, AGGREGATOR_COLUMNS, build_rating_aggregator)
+
+
+def apply_rating(data, user_id, product_id, rating):
+    """Applies a new rating to the cached aggregates of `data`. Returns the rating it replaced, or None."""
+    return get_rating_aggregator(data).apply(user_id, product_id, rating)
+
+
+def unplaced_ratings(data, user_id):
+    """Ratings applied to `data` that the interaction matrix can't hold, e.g. a new sign-up's (see RatingAggregator.unplaced)."""
+    return get_rating_aggregator(data).unplaced_ratings(user_id)
+
+
+def apply_ratings(data, ratings):
+    """
+    Applies a DataFrame of ratings (ID, ProdID, Rating), e.g. firebase_utils.get_ratings_from_firebase().
+    Applying the same rating again changes nothing. Returns the number of ratings.
+    """
+    if ratings is None or ratings.empty:
+        return 0
+    aggregator = get_rating_aggregator(data)
+    for user_id, product_id, rating in ratings[['ID', 'ProdID', 'Rating']].itertuples(index=False):
+        aggregator.apply(user_id, product_id, rating)
+    return len(ratings)
@@ -1,10 +1,12 @@
+
 import pandas as pd
-def get_top_rated_items(data:pd.DataFrame, top_n: int=10) -> pd.DataFrame:
-        """Returns top N products based on average rating."""
-        average_ratings = (data.groupby(['ProdID', 'Name','ReviewCount','Brand','ImageURL'])
-                   ['Rating'].mean().reset_index())
-        top_rated_items = average_ratings.sort_values(by = 'Rating', ascending=False)
-        return top_rated_items.head(top_n)
+
+from product_aggregates import get_product_aggregates
+
+def get_top_rated_items(data:pd.DataFrame, top_n: int=10, by: str='Rating') -> pd.DataFrame:
+        """Returns top N products based on average rating (or by='BayesianScore')."""
+        # Served from the per-product aggregates table, built once per catalog version
+        return get_product_aggregates(data).top_rated(top_n, by)
 
 if __name__ == "__main__":
         import pandas as pd
@@ -0,0 +1,344 @@
+"""
+Two-stage recommendation pipeline shared by the app's recommendation surfaces.
+
+1. Candidate generation: cheap generators each return up to `candidates` ProdIDs with scores
+     popularity         Bayesian-smoothed top rated products (product_aggregates)
+     item_neighbors     products co-rated with the anchor product (item_neighbor_index)
+     content_neighbors  products with similar tags to the anchor product (content model)
+     user_history       item neighbours of the products the user rated highest
+     query_matches      products whose tags match the free-text search query (content model)
+   plus any generator the caller adds (e.g. the precomputed "Recommended for You" list).
+2. Re-ranking: the union of the candidates is scored in one vectorized pass,
+
+       score = sum over generators of weight * minmax(generator score)
+             + quality_weight * minmax(Bayesian score)
+             + content_weight * cosine(candidate tags, anchor product, query or user tag profile)
+
+   and the anchor product and the products the user already rated are dropped.
+
+Every request runs within a latency budget: the generators run concurrently and the ones
+not done when it runs out are left out, and if re-ranking does not finish in the time left
+the candidates are ordered by their generator scores alone. PipelineResult.timings holds
+the seconds spent per stage. warm_up() builds the underlying indexes ahead of the first request.
+
+The stages run on the pipeline's own thread pool. A stage left running past its budget
+keeps its thread, so the same request does not start it again until it finishes, and
+other requests skip it while STRAGGLER_LIMIT calls of it are still running (it is
+reported in `skipped` meanwhile); slow calls or a slow build cannot take every worker.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from als_recommender import get_als_model
+from catalog_index import get_catalog_index
+from collaborative_based_filtering import APPROXIMATE_MIN_USERS
+from content_based_filtering import get_content_model
+from hybrid_approach import STRAGGLER_LIMIT, Stragglers, normalize_scores, run_components
+from interaction_matrix import get_interaction_matrix
+from item_neighbor_index import get_item_neighbor_index
+from product_aggregates import get_product_aggregates
+from user_neighbor_index import get_user_neighbor_index
+
+DETAIL_COLUMNS = ['ProdID', 'Name', 'ImageURL', 'Brand', 'Rating', 'ReviewCount']
+# Candidates asked from each generator
+DEFAULT_CANDIDATES = 200
+# Seconds per request, candidate generation and re-ranking included
+DEFAULT_BUDGET = 0.3
+# Highest rated products of the user used as seeds by the user_history generator
+HISTORY_SEEDS = 20
+
+# Separate from the hybrid recommender's pool, so neither can starve the other. More workers
+# than the timed-out calls that may be left running (7 stages x STRAGGLER_LIMIT), so those
+# never take every worker
+_executor = ThreadPoolExecutor(max_workers=7 * STRAGGLER_LIMIT + 2, thread_name_prefix='pipeline')
+# Calls that ran past their request's budget, by stage and request (see run_components)
+_stragglers = Stragglers()
+
+
+class RecommendationRequest:
+    """What a surface asks for: a user (home), an anchor product (detail) or a search query."""
+
+    def __init__(self, user_id=None, product_id=None, query=None, exclude=()):
+        self.user_id = user_id
+        self.product_id = product_id
+        self.query = query
+        self.exclude = exclude
+
+    @property
+    def key(self):
+        """Identifies the request to run_components: stages of the same request share a straggler."""
+        return (self.user_id, self.product_id, self.query)
+
+
+class PipelineResult:
+    """Recommendations (one row per ProdID, best first, with a Score column) and seconds per stage."""
+
+    def __init__(self, recommendations, timings, skipped=()):
+        self.recommendations = recommendations
+        self.timings = timings
+        # Stages left out because they failed or ran past the budget
+        self.skipped = list(skipped)
+
+
+def anchor_product(data, request):
+    """ProdID the request is about: its product_id, or the product named exactly like its query."""
+    if request.product_id is not None:
+        return request.product_id
+    if request.query:
+        catalog = get_catalog_index(data)
+        position = catalog.position_of_name(request.query)
+        if position is not None:
+            return catalog.product_ids[position]
+    return None
+
+
+def popularity_candidates(data, request, limit):
+    aggregates = get_product_aggregates(data)
+    positions = aggregates.top_positions(limit, by='BayesianScore')
+    return aggregates.catalog.product_ids[positions], aggregates.bayesian_score(positions)
+
+
+def item_neighbor_candidates(data, request, limit):
+    product_id = anchor_product(data, request)
+    if product_id is None:
+        return None
+    return get_item_neighbor_index(data).similar_items(product_id, limit)
+
+
+def content_neighbor_candidates(data, request, limit):
+    product_id = anchor_product(data, request)
+    model = get_content_model(data)
+    position = None if product_id is None else model.position_of_product(product_id)
+    if position is None:
+        return None
+    positions, similarities = model.similar_items(position, limit)
+    return model.item_ids[positions], similarities
+
+
+def query_match_candidates(data, request, limit):
+    if not request.query:
+        return None
+    model = get_content_model(data)
+    positions, similarities = model.search(request.query, limit)
+    return model.item_ids[positions], similarities
+
+
+def user_history_candidates(data, request, limit):
+    """Item neighbours of the user's highest rated products, scored by rating x similarity summed over seeds."""
+    interactions = get_interaction_matrix(data)
+    user_code = None if request.user_id is None else interactions.user_code(request.user_id)
+    if user_code is None:
+        return None
+    row = interactions.user_row(user_code)
+    seeds = np.argsort(-row.data, kind='stable')[:HISTORY_SEEDS]
+    index = get_item_neighbor_index(data)
+    positions = index.positions(interactions.item_ids[row.indices[seeds]])
+    known = positions >= 0
+    if not known.any():
+        return None
+    neighbors = index.neighbors[positions[known]]
+    weights = index.scores[positions[known]] * row.data[seeds][known][:, None]
+    valid = neighbors >= 0
+    scores = np.bincount(neighbors[valid], weights=weights[valid], minlength=len(index.item_ids))
+    top = np.argsort(-scores, kind='stable')[:limit]
+    top = top[scores[top] > 0]
+    return index.item_ids[top], scores[top]
+
+
+def warm_up(data, engine='cosine'):
+    """
+    Builds the structures the generators and the re-ranker read, so requests only look them up.
+    A budget cannot interrupt a build already running, so call this once when the catalog is loaded.
+    engine: the personalized recommender in use ('cosine' or 'als'); its model is built too.
+    """
+    get_catalog_index(data)
+    get_product_aggregates(data)
+    interactions = get_interaction_matrix(data)
+    get_item_neighbor_index(data)
+    get_content_model(data)
+    if engine == 'als':
+        # Loads als_model.npz when it matches the catalog, else trains
+        get_als_model(data)
+    elif interactions.shape[0] >= APPROXIMATE_MIN_USERS:
+        # The user-based recommender searches neighbours in the LSH index from this size on
+        get_user_neighbor_index(data)
+
+
+class RecommendationPipeline:
+    """
+    generators: {name: (generator, weight)}, where generator(data, request, limit) returns
+    (ProdIDs, scores) or None when it has nothing for the request.
+    """
+
+    def __init__(self, generators, quality_weight=0.2, content_weight=0.3,
+                 candidates=DEFAULT_CANDIDATES, budget=DEFAULT_BUDGET):
+        self.generators = generators
+        self.quality_weight = quality_weight
+        self.content_weight = content_weight
+        self.candidates = candidates
+        self.budget = budget
+
+    def with_generator(self, name, generator, weight=1.0):
+        """A copy of the pipeline with one more candidate generator."""
+        return RecommendationPipeline({**self.generators, name: (generator, weight)}, self.quality_weight,
+                                      self.content_weight, self.candidates, self.budget)
+
+    def recommend(self, data, request, top_n=10) -> PipelineResult:
+        started = time.perf_counter()
+        deadline = started + self.budget
+        timings, skipped = {}, []
+
+        # Stage 1: candidate generation, concurrently, within the budget
+        components = {name: (lambda generator=generator: generator(data, request, self.candidates))
+                      for name, (generator, _) in self.generators.items()}
+        generated, generator_timings = run_components(components, timeout=self.budget, executor=_executor,
+                                                      stragglers=_stragglers, key=request.key)
+        skipped += [name for name in components if name not in generated]
+        timings.update({f"generate/{name}": seconds for name, seconds in generator_timings.items()})
+        timings['generate'] = time.perf_counter() - started
+        if not any(result is not None for result in generated.values()):
+            timings['total'] = time.perf_counter() - started
+            return PipelineResult(pd.DataFrame(), timings, skipped)
+
+        catalog = get_catalog_index(data)
+        union, fused = self._fuse(catalog, generated)
+        union, fused = self._drop_excluded(data, request, catalog, union, fused)
+
+        # Stage 2: re-ranking of the union only, in the time left; else generator scores alone
+        scores = fused
+        if len(union):
+            reranked, rerank_timings = run_components(
+                {'rerank': lambda: self._rerank_features(data, request, catalog, union)},
+                timeout=max(0.0, deadline - time.perf_counter()), executor=_executor,
+                stragglers=_stragglers, key=request.key)
+            if 'rerank' in reranked:
+                scores = fused + reranked['rerank']
+                timings['rerank'] = rerank_timings['rerank']
+            else:
+                skipped.append('rerank')
+
+        order = np.argsort(-scores, kind='stable')[:top_n]
+        recommendations = catalog.products.take(union[order])[[c for c in DETAIL_COLUMNS if c in catalog.products]]
+        recommendations = recommendations.assign(Score=scores[order]).reset_index(drop=True)
+        timings['total'] = time.perf_counter() - started
+        return PipelineResult(recommendations if len(recommendations) else pd.DataFrame(), timings, skipped)
+
+    def _fuse(self, catalog, generated):
+        """Catalog positions of the candidate union and their weighted, normalized generator scores."""
+        contributions = []
+        for name, result in generated.items():
+            if result is None:
+                continue
+            product_ids, scores = result
+            positions = catalog.positions(product_ids)
+            known = positions >= 0
+            if known.any():
+                weight = self.generators[name][1]
+                contributions.append((positions[known], weight * normalize_scores(np.asarray(scores)[known])))
+        if not contributions:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        positions = np.concatenate([p for p, _ in contributions])
+        union, inverse = np.unique(positions, return_inverse=True)
+        fused = np.bincount(inverse, weights=np.concatenate([s for _, s in contributions]), minlength=len(union))
+        return union, fused
+
+    def _drop_excluded(self, data, request, catalog, union, fused):
+        excluded = list(request.exclude)
+        product_id = anchor_product(data, request)
+        if product_id is not None:
+            excluded.append(product_id)
+        if request.user_id is not None:
+            interactions = get_interaction_matrix(data)
+            user_code = interactions.user_code(request.user_id)
+            if user_code is not None:
+                excluded.extend(interactions.item_ids[interactions.rated_items(user_code)])
+        if not excluded:
+            return union, fused
+        keep = ~np.isin(union, catalog.positions(excluded))
+        return union[keep], fused[keep]
+
+    def _rerank_features(self, data, request, catalog, union):
+        """quality + content affinity for the candidates at catalog positions `union` (one pass each)."""
+        quality = normalize_scores(get_product_aggregates(data).bayesian_score(union))
+        features = self.quality_weight * quality
+
+        profile = self._content_profile(data, request)
+        if profile is not None:
+            model = get_content_model(data)
+            rows = model.item_index.get_indexer(catalog.product_ids[union])
+            affinity = np.zeros(len(union))
+            found = rows >= 0
+            affinity[found] = model.tfidf_matrix[rows[found]] @ profile
+            features = features + self.content_weight * affinity
+        return features
+
+    def _content_profile(self, data, request):
+        """
+        Dense unit tag vector the candidates are compared with: the anchor product's,
+        else the search query's, else the normalized sum of the user's rated products'.
+        """
+        model = get_content_model(data)
+        product_id = anchor_product(data, request)
+        if product_id is not None:
+            position = model.position_of_product(product_id)
+            return None if position is None else model.tfidf_matrix[position].toarray().ravel()
+        if request.query:
+            query_vector = model.vectorizer.transform([str(request.query)])
+            if query_vector.nnz:
+                return query_vector.toarray().ravel()
+        if request.user_id is None:
+            return None
+        interactions = get_interaction_matrix(data)
+        user_code = interactions.user_code(request.user_id)
+        if user_code is None:
+            return None
+        rows = model.item_index.get_indexer(interactions.item_ids[interactions.rated_items(user_code)])
+        rows = rows[rows >= 0]
+        if len(rows) == 0:
+            return None
+        profile = np.asarray(model.tfidf_matrix[rows].sum(axis=0)).ravel()
+        norm = np.linalg.norm(profile)
+        return None if norm == 0 else profile / norm
+
+
+# Pipelines of the app's surfaces; the app adds its personalized generator to HOME_PIPELINE
+HOME_PIPELINE = RecommendationPipeline({
+    'user_history': (user_history_candidates, 1.0),
+    'popularity': (popularity_candidates, 0.3),
+})
+DETAIL_PIPELINE = RecommendationPipeline({
+    'content_neighbors': (content_neighbor_candidates, 1.0),
+    'item_neighbors': (item_neighbor_candidates, 0.7),
+    'popularity': (popularity_candidates, 0.1),
+}, content_weight=0.5)
+# Search fallback: free-text matches first; user history and popularity fill in
+SEARCH_PIPELINE = RecommendationPipeline({
+    'query_matches': (query_match_candidates, 1.0),
+    'content_neighbors': (content_neighbor_candidates, 1.0),
+    'user_history': (user_history_candidates, 0.3),
+    'popularity': (popularity_candidates, 0.1),
+}, content_weight=0.5)
+
+
+if __name__ == "__main__":
+    from firebase_utils import get_data_from_firebase
+    from preprocess_data import process_data
+
+    raw_data = get_data_from_firebase()
+    if raw_data is None:
+        print("Failed to load data")
+        exit()
+    data = process_data(raw_data)
+
+    for name, pipeline, request in [
+        ('home', HOME_PIPELINE, RecommendationRequest(user_id=4)),
+        ('detail', DETAIL_PIPELINE, RecommendationRequest(product_id=data['ProdID'].iloc[0])),
+    ]:
+        for attempt in ('cold', 'warm'):
+            result = pipeline.recommend(data, request, top_n=8)
+            stages = ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in result.timings.items())
+            print(f"{name} ({attempt}): {len(result.recommendations)} items; {stages}; skipped: {result.skipped}")
+        print(result.recommendations)
@@ -0,0 +1,184 @@
+"""
+Pluggable storage backend for the app's data (/products, /users, /meta).
+
+Every backend exposes the Realtime Database reference API used by firebase_utils:
+reference(path) -> get() / set() / update() / child() / push() / delete() / order_by_child(...).
+
+    firebase  firebase_admin.db (default)
+    sqlite    SQLiteDatabase, a local file with the same semantics (no network)
+    memory    memory_db.InMemoryDatabase (process-local, for tests)
+
+Select with the STORAGE_BACKEND environment variable; LOCAL_DB_PATH sets the SQLite file.
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from memory_db import InMemoryDatabase, _to_node
+
+DEFAULT_LOCAL_DB_PATH = 'local_store.db'
+
+_database = None
+_database_lock = threading.Lock()
+
+
+class SQLiteDatabase(InMemoryDatabase):
+    """
+    Realtime Database semantics persisted in SQLite.
+    The tree is stored one row per second-level node (e.g. 'users/42', 'products/17'),
+    so reading or writing one user or one product touches a single row.
+    """
+
+    def __init__(self, path=DEFAULT_LOCAL_DB_PATH):
+        super().__init__()
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS nodes (path TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._in_transaction = False
+
+    @contextmanager
+    def _transaction(self):
+        """One SQLite transaction per write; nested writes (multi-path update) join the outer one."""
+        with self._lock:
+            if self._in_transaction:
+                yield
+                return
+            self._in_transaction = True
+            self._conn.execute('BEGIN')
+            try:
+                yield
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            finally:
+                self._in_transaction = False
+
+    def close(self):
+        self._conn.close()
+
+    def _rows(self, prefix):
+        """(path, node) rows equal to `prefix` or below it."""
+        if not prefix:
+            cursor = self._conn.execute('SELECT path, value FROM nodes')
+        else:
+            cursor = self._conn.execute(
+                'SELECT path, value FROM nodes WHERE path = ? OR (path >= ? AND path < ?)',
+                (prefix, prefix + '/', prefix + '0'))  # '0' sorts right after '/'
+        return [(path, json.loads(value)) for path, value in cursor]
+
+    def _get(self, parts):
+        if len(parts) >= 2:
+            cursor = self._conn.execute('SELECT value FROM nodes WHERE path = ?', ('/'.join(parts[:2]),))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            node = json.loads(row[0])
+            for part in parts[2:]:
+                if not isinstance(node, dict) or part not in node:
+                    return None
+                node = node[part]
+            return node
+
+        tree = {}
+        for path, node in self._rows(parts[0] if parts else ''):
+            keys = path.split('/')
+            if len(keys) == 1:
+                tree[keys[0]] = node
+            else:
+                first = tree.setdefault(keys[0], {})
+                if isinstance(first, dict):
+                    first[keys[1]] = node
+        if not parts:
+            return tree or None
+        return tree.get(parts[0])
+
+    def _write_rows(self, prefix_parts, node):
+        """Stores `node` at a first-level path, split into second-level rows."""
+        top = prefix_parts[0]
+        if isinstance(node, dict):
+            self._conn.executemany('INSERT OR REPLACE INTO nodes (path, value) VALUES (?, ?)',
+                                   [(f"{top}/{key}", json.dumps(child)) for key, child in node.items()])
+        elif node is not None:
+            self._conn.execute('INSERT OR REPLACE INTO nodes (path, value) VALUES (?, ?)', (top, json.dumps(node)))
+
+    def _set(self, parts, value):
+        value = _to_node(value)
+        with self._transaction():
+            if not parts:
+                self._conn.execute('DELETE FROM nodes')
+                for key, child in (value or {}).items():
+                    self._write_rows([key], child)
+            elif len(parts) == 1:
+                top = parts[0]
+                self._conn.execute('DELETE FROM nodes WHERE path = ? OR (path >= ? AND path < ?)',
+                                   (top, top + '/', top + '0'))
+                self._write_rows(parts, value)
+            else:
+                # Writing below a scalar replaces the scalar
+                self._conn.execute('DELETE FROM nodes WHERE path = ?', (parts[0],))
+                row_path = '/'.join(parts[:2])
+                if len(parts) == 2:
+                    node = value
+                else:
+                    row = self._conn.execute('SELECT value FROM nodes WHERE path = ?', (row_path,)).fetchone()
+                    node = json.loads(row[0]) if row else {}
+                    if not isinstance(node, dict):
+                        node = {}
+                    parent = node
+                    for part in parts[2:-1]:
+                        child = parent.get(part)
+                        if not isinstance(child, dict):
+                            child = {}
+                            parent[part] = child
+                        parent = child
+                    if value is None:
+                        parent.pop(parts[-1], None)
+                    else:
+                        parent[parts[-1]] = value
+                    node = node or None
+                if node is None:
+                    self._conn.execute('DELETE FROM nodes WHERE path = ?', (row_path,))
+                else:
+                    self._conn.execute('INSERT OR REPLACE INTO nodes (path, value) VALUES (?, ?)',
+                                       (row_path, json.dumps(node)))
+
+
+def create_database(backend=None, local_path=None):
+    """Creates the backend named by `backend` (or STORAGE_BACKEND), default 'firebase'."""
+    backend = (backend or os.environ.get('STORAGE_BACKEND', 'firebase')).lower()
+    if backend == 'firebase':
+        from firebase_admin import db
+        return db
+    if backend == 'sqlite':
+        return SQLiteDatabase(local_path or os.environ.get('LOCAL_DB_PATH', DEFAULT_LOCAL_DB_PATH))
+    if backend == 'memory':
+        return InMemoryDatabase()
+    raise ValueError(f"Unknown storage backend '{backend}' (expected firebase, sqlite or memory).")
+
+
+def get_database():
+    """Returns the configured backend, created on first use."""
+    global _database
+    with _database_lock:
+        if _database is None:
+            _database = create_database()
+        return _database
+
+
+def set_database(database):
+    """Overrides the backend (e.g. an InMemoryDatabase in tests or benchmarks)."""
+    global _database
+    with _database_lock:
+        _database = database
+
+
+def is_firebase_backend():
+    """True when the data lives in Firebase, so firebase_admin must be initialized."""
+    if _database is not None:
+        return getattr(_database, '__name__', '') == 'firebase_admin.db'
+    return os.environ.get('STORAGE_BACKEND', 'firebase').lower() == 'firebase'
+
@@ -0,0 +1,96 @@
+import pandas as pd
+import pytest
+
+import catalog_snapshot
+from catalog_snapshot import load_catalog, read_snapshot_version
+
+
+class Remote:
+    """Published version and catalog; counts the catalog downloads."""
+
+    def __init__(self, version=None):
+        self.version = version
+        self.offline = False
+        self.fetches = 0
+
+    def fetch_version(self):
+        if self.offline:
+            raise ConnectionError("offline")
+        return self.version
+
+    def fetch_catalog(self):
+        self.fetches += 1
+        return pd.DataFrame({'ProdID': [1, 2], 'Name': ['a', 'b']})
+
+
+@pytest.fixture
+def path(tmp_path, monkeypatch):
+    # Nothing loaded in this process yet
+    monkeypatch.setattr(catalog_snapshot, '_loaded', (None, None, 0.0))
+    return str(tmp_path / 'catalog.parquet')
+
+
+def load(remote, path):
+    return load_catalog(remote.fetch_version, remote.fetch_catalog, lambda raw: raw, path)
+
+
+def test_unchanged_version_is_served_without_download(path):
+    remote = Remote('v1')
+    first = load(remote, path)
+    assert remote.fetches == 1
+    assert read_snapshot_version(path) == 'v1'
+    assert load(remote, path) is first
+    assert remote.fetches == 1
+
+
+def test_snapshot_is_used_by_a_new_process(path, monkeypatch):
+    remote = Remote('v1')
+    load(remote, path)
+    monkeypatch.setattr(catalog_snapshot, '_loaded', (None, None, 0.0))
+    data = load(remote, path)
+    assert remote.fetches == 1
+    assert list(data['Name']) == ['a', 'b']
+
+
+def test_new_version_is_downloaded(path):
+    remote = Remote('v1')
+    load(remote, path)
+    remote.version = 'v2'
+    load(remote, path)
+    assert remote.fetches == 2
+    assert read_snapshot_version(path) == 'v2'
+
+
+def test_unpublished_version_is_trusted_for_the_ttl_only(path, monkeypatch):
+    remote = Remote(None)
+    load(remote, path)
+    load(remote, path)
+    assert remote.fetches == 1
+
+    monkeypatch.setattr(catalog_snapshot, 'UNVERSIONED_TTL', 0)
+    load(remote, path)
+    assert remote.fetches == 2
+
+
+def test_offline_serves_the_snapshot_and_checks_again_later(path, monkeypatch):
+    remote = Remote('v1')
+    load(remote, path)
+    monkeypatch.setattr(catalog_snapshot, '_loaded', (None, None, 0.0))
+
+    remote.offline = True
+    remote.version = 'v2'
+    data = load(remote, path)
+    assert list(data['Name']) == ['a', 'b']
+    assert remote.fetches == 1
+
+    remote.offline = False
+    load(remote, path)
+    assert remote.fetches == 2
+    assert read_snapshot_version(path) == 'v2'
+
+
+def test_offline_without_snapshot_returns_none(path):
+    remote = Remote('v1')
+    remote.offline = True
+    assert load(remote, path) is None
+    assert remote.fetches == 0
@@ -0,0 +1,62 @@
+import pytest
+
+from catalog_snapshot import CATALOG_VERSION_PATH
+from catalog_sync import (DELETED, SERVER_TIMESTAMP, UPDATED_AT, CatalogSync, stamp_records,
+                          write_product_changes)
+from memory_db import InMemoryDatabase
+
+
+@pytest.fixture
+def database():
+    database = InMemoryDatabase()
+    write_product_changes(database, {0: {'Name': 'a'}, 1: {'Name': 'b'}})
+    return database
+
+
+def test_records_are_stamped_by_the_server(database):
+    assert stamp_records([{'Name': 'a'}]) == [{'Name': 'a', UPDATED_AT: SERVER_TIMESTAMP}]
+    assert isinstance(database.reference('/products/0/updated_at').get(), int)
+    assert database.reference(CATALOG_VERSION_PATH).get() is not None
+
+
+def test_full_load_then_incremental_changes(database):
+    sync = CatalogSync(database)
+    assert list(sync.fetch()['Name']) == ['a', 'b']
+
+    write_product_changes(database, {1: {'Name': 'b2'}, 2: {'Name': 'c'}})
+    assert sync.pull_changes() == 2
+    assert list(sync.to_frame()['Name']) == ['a', 'b2', 'c']
+    assert UPDATED_AT not in sync.to_frame()
+
+
+def test_deletions_arrive_as_tombstones(database):
+    sync = CatalogSync(database)
+    sync.fetch()
+    write_product_changes(database, {0: None})
+    assert database.reference('/products/0').get()[DELETED] is True
+    assert list(sync.fetch()['Name']) == ['b']
+
+
+def test_rereads_in_the_overlap_window_are_not_applied_twice(database):
+    sync = CatalogSync(database)
+    sync.fetch()
+    assert sync.pull_changes() == 0
+    write_product_changes(database, {0: None})
+    assert sync.pull_changes() == 1
+    assert sync.pull_changes() == 0
+
+
+def test_late_write_with_an_older_stamp_is_not_lost(database):
+    sync = CatalogSync(database)
+    sync.fetch()
+    # Committed after the sync by a concurrent writer, but stamped before it
+    database.reference('/products/2').set({'Name': 'c', UPDATED_AT: sync.last_synced - 1000})
+    assert sync.pull_changes() == 1
+    assert list(sync.to_frame()['Name']) == ['a', 'b', 'c']
+
+
+def test_writes_older_than_the_overlap_window_are_not_reread(database):
+    sync = CatalogSync(database, overlap_ms=10)
+    sync.fetch()
+    database.reference('/products/2').set({'Name': 'c', UPDATED_AT: sync.last_synced - 1000})
+    assert sync.pull_changes() == 0
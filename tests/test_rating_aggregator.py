@@ -0,0 +1,126 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import catalog_cache
+from collaborative_based_filtering import score_items_for_user, score_items_for_users
+from interaction_matrix import build_interaction_matrix, get_interaction_matrix
+from product_aggregates import get_product_aggregates
+from rating_aggregator import apply_rating, apply_ratings, get_rating_aggregator, unplaced_ratings
+
+
+def make_ratings(n_users=60, n_items=40, n_ratings=600, seed=0):
+    rng = np.random.default_rng(seed)
+    ratings = pd.DataFrame({
+        'ID': rng.integers(1, n_users + 1, n_ratings),
+        'ProdID': rng.integers(1, n_items + 1, n_ratings),
+        'Rating': rng.integers(1, 6, n_ratings).astype(float),
+    }).drop_duplicates(['ID', 'ProdID'])
+    ratings['Name'] = 'Product ' + ratings['ProdID'].astype(str)
+    ratings['ReviewCount'] = 1
+    return ratings.reset_index(drop=True)
+
+
+@pytest.fixture
+def data():
+    return make_ratings()
+
+
+def new_pairs(data, count, seed=1):
+    """(user, product, rating) triples not rated in `data`, between known users and products."""
+    rng = np.random.default_rng(seed)
+    rated = set(zip(data['ID'], data['ProdID']))
+    users, products = data['ID'].unique(), data['ProdID'].unique()
+    pairs = []
+    while len(pairs) < count:
+        pair = (int(rng.choice(users)), int(rng.choice(products)))
+        if pair not in rated:
+            rated.add(pair)
+            pairs.append((*pair, float(rng.integers(1, 6))))
+    return pairs
+
+
+def test_added_ratings_are_scored_like_a_rebuild(data):
+    pairs = new_pairs(data, 40)
+    for user_id, product_id, rating in pairs:
+        apply_rating(data, user_id, product_id, rating)
+    interactions = get_interaction_matrix(data)
+    assert len(interactions.overlay_users())
+
+    rebuilt = build_interaction_matrix(pd.concat([data, pd.DataFrame(pairs, columns=['ID', 'ProdID', 'Rating'])]))
+    codes = np.arange(interactions.shape[0])
+    for code in codes:
+        np.testing.assert_allclose(score_items_for_user(interactions, code, 10),
+                                   score_items_for_user(rebuilt, code, 10), rtol=1e-5)
+    np.testing.assert_allclose(score_items_for_users(interactions, codes, 10),
+                               score_items_for_users(rebuilt, codes, 10), rtol=1e-5)
+
+
+def test_rated_state_survives_lru_eviction(data):
+    user_id, product_id, rating = new_pairs(data, 1)[0]
+    interactions, aggregates = get_interaction_matrix(data), get_product_aggregates(data)
+    apply_rating(data, user_id, product_id, rating)
+    catalog_cache._cache.clear()
+
+    assert get_interaction_matrix(data) is interactions
+    assert get_product_aggregates(data) is aggregates
+    assert product_id in interactions.item_ids[interactions.rated_items(interactions.user_code(user_id))]
+
+
+def test_stored_ratings_can_be_applied_again(data):
+    stored = pd.DataFrame(new_pairs(data, 20), columns=['ID', 'ProdID', 'Rating'])
+    assert apply_ratings(data, stored) == 20
+    interactions, aggregates = get_interaction_matrix(data), get_product_aggregates(data)
+    user_sum = get_rating_aggregator(data).user_sum.copy()
+    table = aggregates.table()
+
+    # Each catalog reload applies every stored rating again
+    apply_ratings(data, stored)
+    np.testing.assert_array_equal(get_rating_aggregator(data).user_sum, user_sum)
+    pd.testing.assert_frame_equal(aggregates.table(), table)
+    for user_id, product_id, rating in stored.itertuples(index=False):
+        code = interactions.user_code(user_id)
+        assert product_id in interactions.item_ids[interactions.rated_items(code)]
+    assert apply_ratings(data, None) == 0
+
+
+def test_new_users_ratings_are_kept_unplaced(data):
+    new_user = int(data['ID'].max()) + 1
+    product_id = int(data['ProdID'].iloc[0])
+    apply_rating(data, new_user, product_id, 4.0)
+    apply_rating(data, new_user, product_id, 5.0)
+    assert unplaced_ratings(data, new_user) == {product_id: 5.0}
+    assert unplaced_ratings(data, int(data['ID'].iloc[0])) == {}
+    assert get_rating_aggregator(data).user_mean(new_user) == 5.0
+
+
+def test_interaction_matrix_pickles_with_its_added_ratings(data):
+    for user_id, product_id, rating in new_pairs(data, 10):
+        apply_rating(data, user_id, product_id, rating)
+    interactions = get_interaction_matrix(data)
+    interactions.normalized  # derived views are rebuilt after unpickling, not copied
+    copied = pickle.loads(pickle.dumps(interactions))
+
+    codes = np.arange(interactions.shape[0])
+    np.testing.assert_allclose(score_items_for_users(copied, codes, 10),
+                               score_items_for_users(interactions, codes, 10), rtol=1e-6)
+    # The copy is independent and has a working lock
+    before = interactions.user_row(0).toarray()
+    copied.set_rating(0, interactions.shape[1] - 1, 0.5)
+    np.testing.assert_array_equal(interactions.user_row(0).toarray(), before)
+
+
+def test_rankings_stay_sorted_after_updates(data, monkeypatch):
+    # Small blocks, so updates move products across blocks and split them
+    monkeypatch.setattr('product_aggregates.RANKING_BLOCK_SIZE', 4)
+    aggregates = get_product_aggregates(make_ratings(seed=3))
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        product_id = int(rng.choice(aggregates.catalog.product_ids))
+        aggregates.add_rating(product_id, float(rng.integers(1, 6)))
+
+    scores = aggregates.bayesian_score()
+    expected = np.lexsort((aggregates.catalog.product_ids, -scores))
+    assert aggregates.top_positions(len(scores), by='BayesianScore') == expected.tolist()
@@ -0,0 +1,49 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from hybrid_approach import Stragglers, run_components
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def test_results_and_failures(executor):
+    def fail():
+        raise ValueError("boom")
+
+    results, timings = run_components({'a': lambda: 1, 'b': fail}, timeout=1.0, executor=executor)
+    assert results == {'a': 1}
+    assert set(timings) == {'a'}
+
+
+def test_timed_out_call_is_not_started_again_until_it_finishes(executor):
+    release = threading.Event()
+    stragglers = Stragglers(limit=2)
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 'slow'
+
+    components = {'slow': slow, 'fast': lambda: 'fast'}
+    assert run_components(components, 0.05, executor, stragglers, key='u1')[0] == {'fast': 'fast'}
+    # Same request again: held back, the fast component still runs
+    assert run_components(components, 0.05, executor, stragglers, key='u1')[0] == {'fast': 'fast'}
+    assert len(calls) == 1
+
+    # Another request may still run it, up to the limit
+    run_components(components, 0.05, executor, stragglers, key='u2')
+    run_components(components, 0.05, executor, stragglers, key='u3')
+    assert len(calls) == 2
+
+    release.set()
+    executor.shutdown(wait=True)
+    assert not stragglers.holds_back('slow', 'u1')
+    assert not stragglers.holds_back('slow', 'u3')
@@ -0,0 +1,90 @@
+import pytest
+
+from memory_db import InMemoryDatabase
+from storage import SQLiteDatabase
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def database(request, tmp_path):
+    if request.param == 'memory':
+        yield InMemoryDatabase()
+    else:
+        database = SQLiteDatabase(str(tmp_path / 'store.db'))
+        yield database
+        database.close()
+
+
+def test_set_and_get_nested_values(database):
+    database.reference('/users/42').set({'name': 'Alice', 'address': {'city': 'Oslo'}})
+    assert database.reference('/users/42').get() == {'name': 'Alice', 'address': {'city': 'Oslo'}}
+    assert database.reference('/users/42/address/city').get() == 'Oslo'
+    assert database.reference('/users').child('42').child('name').get() == 'Alice'
+    assert database.reference('/users/43').get() is None
+
+
+def test_lists_are_read_back_as_lists(database):
+    database.reference('/users/1/wishlist').set([3, 1, 2])
+    assert database.reference('/users/1/wishlist').get() == [3, 1, 2]
+    database.reference('/products').set([{'Name': 'a'}, {'Name': 'b'}])
+    assert database.reference('/products').get() == [{'Name': 'a'}, {'Name': 'b'}]
+
+
+def test_setting_none_deletes(database):
+    database.reference('/users/1').set({'name': 'a', 'email': 'a@x.com'})
+    database.reference('/users/1/email').set(None)
+    assert database.reference('/users/1').get() == {'name': 'a'}
+    database.reference('/users/1').delete()
+    assert database.reference('/users/1').get() is None
+
+
+def test_multi_path_update(database):
+    database.reference('/users/u1').set({'name': 'a'})
+    database.reference('/').update({'users/u1/name': 'b', 'users/u2': {'name': 'c'}, 'meta/count': 2})
+    assert database.reference('/users').get() == {'u1': {'name': 'b'}, 'u2': {'name': 'c'}}
+    assert database.reference('/meta/count').get() == 2
+
+
+def test_server_timestamp_is_resolved(database):
+    database.reference('/products/0').set({'Name': 'a', 'updated_at': {'.sv': 'timestamp'}})
+    stamp = database.reference('/products/0/updated_at').get()
+    assert isinstance(stamp, int) and stamp > 0
+
+
+def test_shallow_get_returns_keys_only(database):
+    database.reference('/products').set({'0': {'Name': 'a'}, '5': {'Name': 'b'}})
+    assert database.reference('/products').get(shallow=True) == {'0': True, '5': True}
+
+
+def test_push_keys_are_ordered(database):
+    first = database.reference('/orders').push({'n': 1})
+    second = database.reference('/orders').push({'n': 2})
+    assert first.key < second.key
+    assert list(database.reference('/orders').get()) == [first.key, second.key]
+
+
+def test_order_by_child_queries(database):
+    database.reference('/users').set({
+        'a': {'email': 'a@x.com', 'age': 30},
+        'b': {'email': 'b@x.com', 'age': 20},
+        'c': {'email': 'c@x.com', 'age': 40},
+        'd': {'email': 'd@x.com'},
+    })
+    users = database.reference('/users')
+    assert list(users.order_by_child('email').equal_to('b@x.com').get()) == ['b']
+    assert list(users.order_by_child('age').start_at(25).get()) == ['a', 'c']
+    assert list(users.order_by_child('age').end_at(30).get()) == ['b', 'a']
+    assert list(users.order_by_child('age').limit_to_last(1).get()) == ['c']
+    assert list(users.order_by_child('age').limit_to_first(2).get()) == ['b', 'a']
+
+
+def test_sqlite_persists_across_connections(tmp_path):
+    path = str(tmp_path / 'store.db')
+    database = SQLiteDatabase(path)
+    database.reference('/users/1').set({'name': 'a'})
+    database.close()
+
+    reopened = SQLiteDatabase(path)
+    try:
+        assert reopened.reference('/users/1/name').get() == 'a'
+    finally:
+        reopened.close()
@@ -0,0 +1,90 @@
+import pytest
+
+from memory_db import InMemoryDatabase
+from user_repository import EMAIL_INDEX_BUILT_PATH, EMAIL_INDEX_PATH, UserRepository, email_key
+
+
+@pytest.fixture
+def database():
+    return InMemoryDatabase()
+
+
+@pytest.fixture
+def repository(database):
+    return UserRepository(database, ttl=60)
+
+
+def test_saved_user_is_found_by_email_in_any_case(repository):
+    repository.save({'user_id': 'u1', 'email': 'Alice@Example.com', 'name': 'Alice'})
+    assert repository.find_by_email('alice@example.com') == ('u1', {'user_id': 'u1', 'email': 'Alice@Example.com', 'name': 'Alice'})
+    assert repository.find_by_email(' ALICE@EXAMPLE.COM ')[0] == 'u1'
+    assert repository.find_by_email('bob@example.com') == (None, None)
+
+
+def test_email_keys_are_valid_firebase_keys():
+    key = email_key('first.last#1@mail.example.com')
+    assert not any(c in key for c in '.#$[]/')
+    assert key == email_key('First.Last#1@Mail.Example.com')
+
+
+def test_changing_the_email_moves_the_index_entry(database, repository):
+    repository.save({'user_id': 'u1', 'email': 'old@example.com'})
+    repository.save({'user_id': 'u1', 'email': 'new@example.com'})
+    assert repository.find_by_email('new@example.com')[0] == 'u1'
+    assert repository.find_by_email('old@example.com') == (None, None)
+    assert database.reference(f"{EMAIL_INDEX_PATH}/{email_key('old@example.com')}").get() is None
+
+
+def test_stale_index_entry_is_not_trusted(database, repository):
+    repository.save({'user_id': 'u1', 'email': 'a@example.com'})
+    # Email changed by a writer that did not update the index
+    database.reference('/users/u1/email').set('b@example.com')
+    repository.invalidate('u1')
+    assert repository.find_by_email('a@example.com') == (None, None)
+
+
+def test_users_saved_before_the_index_are_indexed_on_first_miss(database, repository):
+    database.reference('/users').set({'u1': {'email': 'A@example.com'}, 'u2': {'email': 'b@example.com'}, 'u3': {'name': 'no email'}})
+    assert repository.find_by_email('a@example.com')[0] == 'u1'
+    assert database.reference(EMAIL_INDEX_BUILT_PATH).get() is True
+    assert set(database.reference(EMAIL_INDEX_PATH).get()) == {email_key('a@example.com'), email_key('b@example.com')}
+
+    # Built once per database: a new instance does not rebuild it
+    database.reference('/users/u4').set({'email': 'd@example.com'})
+    assert UserRepository(database).find_by_email('d@example.com') == (None, None)
+
+
+def test_reads_are_cached_until_invalidated(database, repository):
+    repository.save({'user_id': 'u1', 'name': 'a'})
+    assert repository.get('u1')['name'] == 'a'
+    database.reference('/users/u1/name').set('b')
+    assert repository.get('u1')['name'] == 'a'
+    repository.invalidate('u1')
+    assert repository.get('u1')['name'] == 'b'
+
+
+def test_save_invalidates_the_cached_record(repository):
+    repository.save({'user_id': 'u1', 'name': 'a'})
+    assert repository.get('u1')['name'] == 'a'
+    repository.save({'user_id': 'u1', 'name': 'b'})
+    assert repository.get('u1')['name'] == 'b'
+
+
+def test_missing_users_are_cached_too(database, repository):
+    assert repository.get('u1') is None
+    database.reference('/users/u1').set({'name': 'a'})
+    assert repository.get('u1') is None
+    repository.invalidate()
+    assert repository.get('u1') == {'name': 'a'}
+
+
+def test_returned_records_are_copies(repository):
+    repository.save({'user_id': 'u1', 'name': 'a'})
+    repository.get('u1')['name'] = 'changed'
+    assert repository.get('u1')['name'] == 'a'
+
+
+def test_invalid_user_ids_are_not_read(repository):
+    assert repository.get('') is None
+    assert repository.get('a/b') is None
+    assert not repository.exists('a.b')
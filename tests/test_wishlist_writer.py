@@ -0,0 +1,132 @@
+import threading
+
+import pytest
+
+from wishlist_writer import WishlistWriter
+
+
+class RecordingWrite:
+    def __init__(self, fail_times=0):
+        self.writes = []
+        self.fail_times = fail_times
+
+    def __call__(self, user_id, items):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("database unavailable")
+        self.writes.append((user_id, list(items)))
+
+
+@pytest.fixture
+def write():
+    return RecordingWrite()
+
+
+@pytest.fixture
+def writer(write):
+    # Long interval: the tests flush explicitly
+    writer = WishlistWriter(write, interval=60)
+    yield writer
+    writer.close()
+
+
+def test_repeated_updates_coalesce_into_one_write(writer, write):
+    writer.enqueue(1, [10])
+    writer.enqueue(1, [10, 11])
+    writer.enqueue('1', [10, 11, 12])
+    assert writer.pending(1) == [10, 11, 12]
+
+    assert writer.flush() == 1
+    assert write.writes == [('1', [10, 11, 12])]
+    assert writer.pending(1) is None
+
+
+def test_flush_of_one_user_leaves_the_others_queued(writer, write):
+    writer.enqueue(1, [10])
+    writer.enqueue(2, [20])
+
+    assert writer.flush(1) == 1
+    assert write.writes == [('1', [10])]
+    assert writer.pending(2) == [20]
+
+
+def test_older_tickets_are_acked_by_a_newer_write(writer):
+    first = writer.enqueue(1, [10])
+    second = writer.enqueue(1, [11])
+    assert not writer.acked(first)
+
+    writer.flush()
+    assert writer.acked(first)
+    assert writer.acked(second)
+
+
+def test_ticket_of_another_user_is_not_acked(writer):
+    writer.enqueue(1, [10])
+    other = writer.enqueue(2, [20])
+    writer.flush(1)
+    assert not writer.acked(other)
+
+
+def test_failed_write_stays_queued_and_is_retried():
+    write = RecordingWrite(fail_times=1)
+    writer = WishlistWriter(write, interval=60)
+    try:
+        ticket = writer.enqueue(1, [10])
+        assert writer.flush() == 0
+        assert not writer.acked(ticket)
+        assert writer.pending(1) == [10]
+        assert isinstance(writer.last_error, RuntimeError)
+
+        assert writer.flush() == 1
+        assert writer.acked(ticket)
+    finally:
+        writer.close()
+
+
+def test_update_queued_during_a_write_is_kept(write):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_write(user_id, items):
+        started.set()
+        release.wait(5)
+        write(user_id, items)
+
+    writer = WishlistWriter(slow_write, interval=60)
+    try:
+        writer.enqueue(1, [10])
+        flushing = threading.Thread(target=writer.flush)
+        flushing.start()
+        assert started.wait(5)
+        newer = writer.enqueue(1, [10, 11])
+        release.set()
+        flushing.join(5)
+
+        assert writer.pending(1) == [10, 11]
+        assert not writer.acked(newer)
+        writer.flush()
+        assert writer.acked(newer)
+        assert write.writes[-1] == ('1', [10, 11])
+    finally:
+        writer.close()
+
+
+def test_wait_returns_once_the_background_thread_wrote(write):
+    writer = WishlistWriter(write, interval=0.01)
+    try:
+        ticket = writer.enqueue(1, [10])
+        assert writer.wait(ticket, timeout=5)
+        assert write.writes == [('1', [10])]
+    finally:
+        writer.close()
+
+
+def test_wait_times_out_without_a_flush(writer):
+    ticket = writer.enqueue(1, [10])
+    assert not writer.wait(ticket, timeout=0.01)
+
+
+def test_close_writes_what_is_pending(write):
+    writer = WishlistWriter(write, interval=60)
+    writer.enqueue(1, [10])
+    writer.close()
+    assert write.writes == [('1', [10])]
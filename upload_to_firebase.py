@@ -1,46 +1,168 @@
-
 import firebase_admin
 from firebase_admin import credentials
-from firebase_admin import db
 import pandas as pd
 import json
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+from catalog_snapshot import CATALOG_VERSION_PATH, new_catalog_version
+from catalog_sync import PRODUCTS_COUNT_PATH, PRODUCTS_PATH, stamp_records, write_product_changes
+from storage import get_database, is_firebase_backend
 
-# 1. Initialize Firebase
+# 1. Initialize Firebase (skipped for a local backend, e.g. STORAGE_BACKEND=sqlite to seed a local store)
 # Make sure serviceAccountKey.json is in the same directory
-cred = credentials.Certificate('serviceAccountKey.json')
+if is_firebase_backend():
+    cred = credentials.Certificate('serviceAccountKey.json')
+
+    # Initialize with the provided DB URL
+    firebase_admin.initialize_app(cred, {
+        'databaseURL': 'https://ai-based-recommendation-55bcb-default-rtdb.asia-southeast1.firebasedatabase.app/'
+    })
+
+CHECKPOINT_PATH = 'upload_checkpoint.json'
+
+def load_checkpoint(csv_path, chunk_size):
+    """Returns the checkpoint of an interrupted upload of the same file, or None."""
+    if not os.path.exists(CHECKPOINT_PATH):
+        return None
+    with open(CHECKPOINT_PATH) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('source') != os.path.abspath(csv_path) or checkpoint.get('chunk_size') != chunk_size:
+        return None
+    return checkpoint
+
+def save_checkpoint(checkpoint):
+    tmp_path = CHECKPOINT_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+def upload_chunk(ref, start_index, records, retries=3):
+    """Writes one chunk as a single multi-path update ({index: record}), retrying with backoff."""
+    update = {str(start_index + i): record for i, record in enumerate(records)}
+    for attempt in range(retries):
+        try:
+            ref.update(update)
+            return len(json.dumps(update))
+        except Exception:
+            if attempt == retries - 1:
+                raise
+            time.sleep(2 ** attempt)
 
-# Initialize with the provided DB URL
-firebase_admin.initialize_app(cred, {
-    'databaseURL': 'https://ai-based-recommendation-55bcb-default-rtdb.asia-southeast1.firebasedatabase.app/'
-})
+def existing_product_count(database):
+    """Index keys used under /products: the count of the last upload, else one past the highest key."""
+    count = database.reference(PRODUCTS_COUNT_PATH).get()
+    if count is not None:
+        return count
+    # No upload recorded a count yet (e.g. the data predates it): read the keys only
+    keys = database.reference(PRODUCTS_PATH).get(shallow=True) or {}
+    if isinstance(keys, list):
+        return len(keys)
+    indices = [int(key) for key in keys if str(key).isdigit()]
+    return max(indices) + 1 if indices else 0
 
-def upload_data():
+def upload_data(csv_path='clean_data.csv', chunk_size=500, max_workers=4, resume=True):
+    """
+    Streams the CSV to /products in chunks of `chunk_size` records, written in parallel
+    by at most `max_workers` threads. Finished chunks are recorded in upload_checkpoint.json,
+    so a failed upload resumes from where it stopped instead of starting over.
+    """
     print("Reading CSV...")
     try:
-        df = pd.read_csv('clean_data.csv')
-        
-        # Replace NaN with safe values (Firebase doesn't like NaNs)
-        df = df.fillna("")
-        
-        # Convert to dictionary format
-        # orient='records' gives a list of dicts: [{}, {}, ...]
-        records = df.to_dict(orient='records')
-        
-        print(f"Uploading {len(records)} products to Firebase...")
-        
+        checkpoint = load_checkpoint(csv_path, chunk_size) if resume else None
+        if checkpoint is None:
+            checkpoint = {'source': os.path.abspath(csv_path), 'chunk_size': chunk_size, 'done': []}
+        else:
+            print(f"Resuming upload: {len(checkpoint['done'])} chunks already committed.")
+        done = set(checkpoint['done'])
+        lock = threading.Lock()
+
         # Get reference to the root/products node
-        ref = db.reference('/products')
-        
-        # Set the data (this overwrites existing data at this path)
-        ref.set(records)
-        
+        ref = get_database().reference(PRODUCTS_PATH)
+
+        total_records = 0
+        uploaded_records = 0
+        uploaded_bytes = 0
+        failures = []
+        started = time.perf_counter()
+
+        def collect(future, chunk_index, count):
+            """Records a finished chunk in the checkpoint; failures are reported after all chunks ran."""
+            nonlocal uploaded_records, uploaded_bytes
+            try:
+                uploaded_bytes += future.result()
+            except Exception as e:
+                failures.append((chunk_index, e))
+                return
+            uploaded_records += count
+            with lock:
+                done.add(chunk_index)
+                checkpoint['done'] = sorted(done)
+                save_checkpoint(checkpoint)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = {}
+            # Stream the file so only a few chunks are held in memory at once
+            for chunk_index, df in enumerate(pd.read_csv(csv_path, chunksize=chunk_size)):
+                start_index = chunk_index * chunk_size
+                total_records = start_index + len(df)
+                if chunk_index in done:
+                    continue
+
+                # Replace NaN with safe values (Firebase doesn't like NaNs)
+                df = df.fillna("")
+                # orient='records' gives a list of dicts: [{}, {}, ...]
+                # Stamp records so app instances can sync changes incrementally; the server
+                # stamps each chunk when it is written, so a sync between chunks misses none
+                records = stamp_records(df.to_dict(orient='records'))
+
+                future = executor.submit(upload_chunk, ref, start_index, records)
+                in_flight[future] = (chunk_index, len(records))
+
+                # Bound the number of pending chunks
+                if len(in_flight) >= 2 * max_workers:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for f in finished:
+                        collect(f, *in_flight.pop(f))
+
+            for f in as_completed(list(in_flight)):
+                collect(f, *in_flight.pop(f))
+
+        if failures:
+            chunk_index, error = failures[0]
+            raise RuntimeError(f"{len(failures)} chunk(s) failed, first was chunk {chunk_index}: {error}")
+
+        # Tombstone records left over from a previous, longer upload
+        previous_count = existing_product_count(get_database())
+        if previous_count > total_records:
+            write_product_changes(get_database(), {i: None for i in range(total_records, previous_count)})
+        get_database().reference(PRODUCTS_COUNT_PATH).set(total_records)
+
+        # Publish a new catalog version so app instances refresh their local snapshot
+        get_database().reference(CATALOG_VERSION_PATH).set(new_catalog_version())
+        os.remove(CHECKPOINT_PATH)
+
+        elapsed = time.perf_counter() - started
+        print(f"Uploaded {uploaded_records} of {total_records} products in {elapsed:.1f}s "
+              f"({uploaded_records / max(elapsed, 1e-9):.0f} records/s, "
+              f"{uploaded_bytes / 1e6 / max(elapsed, 1e-9):.2f} MB/s)")
         print("Upload successful! ✅")
         
     except FileNotFoundError:
         print("Error: Dataset file not found!")
     except Exception as e:
         print(f"Error occurred: {e}")
+        if os.path.exists(CHECKPOINT_PATH):
+            print("Committed chunks are saved; run again to resume the upload.")
 
 if __name__ == "__main__":
-    upload_data()
+    import argparse
+    parser = argparse.ArgumentParser(description="Upload clean_data.csv to /products in parallel chunks.")
+    parser.add_argument('--csv', default='clean_data.csv')
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--no-resume', action='store_true', help="Ignore upload_checkpoint.json and start over")
+    args = parser.parse_args()
+    upload_data(args.csv, args.chunk_size, args.workers, resume=not args.no_resume)
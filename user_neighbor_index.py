@@ -0,0 +1,188 @@
+"""
+Approximate nearest-neighbour index over the L2-normalized user rating vectors
+(random-projection LSH for cosine similarity, Charikar 2002).
+
+Each of `n_tables` hash tables projects a user's row onto `n_bits` random hyperplanes
+and keys the user by the sign pattern; users with a small angle between them agree on
+most signs. A query collects the users sharing its bucket in every table, plus the
+buckets `probes` bit flips away (the bits whose projections were closest to zero),
+and ranks those candidates by exact cosine similarity.
+
+Recall/latency trade-off:
+  n_tables        more tables -> higher recall, more candidates, more memory
+  n_bits          more bits -> smaller buckets, fewer candidates, lower recall
+  probes          extra buckets probed per table -> higher recall, more candidates
+  max_candidates  caps the exactly re-ranked candidates (the most frequently hashed together are kept)
+
+`python user_neighbor_index.py` reports build time, memory, query latency and
+recall@k against exact search for a few settings.
+"""
+import time
+
+import numpy as np
+
+from catalog_cache import cached_build
+from interaction_matrix import INTERACTION_COLUMNS, get_interaction_matrix
+from ranking import top_n_indices
+
+DEFAULT_TABLES = 12
+DEFAULT_PROBES = 4
+DEFAULT_MAX_CANDIDATES = 5000
+# Target users per bucket when n_bits is not given
+BUCKET_SIZE = 64
+# Users hashed per projection block while building (block x n_tables * n_bits floats)
+BUILD_BLOCK_SIZE = 65536
+
+
+def _bucket_keys(projections, n_tables, n_bits):
+    """(rows x n_tables) int64 bucket keys from (rows x n_tables * n_bits) projections."""
+    bits = (projections > 0).reshape(len(projections), n_tables, n_bits)
+    return bits.astype(np.int64) @ np.left_shift(np.int64(1), np.arange(n_bits, dtype=np.int64))
+
+
+class UserNeighborIndex:
+    """LSH tables over the rows of `interactions.normalized`; query with top_k_similar_users()."""
+
+    def __init__(self, interactions, planes, keys, orders, probes=DEFAULT_PROBES,
+                 max_candidates=DEFAULT_MAX_CANDIDATES, build_seconds=0.0):
+        self.interactions = interactions
+        # products x (n_tables * n_bits) random hyperplanes
+        self.planes = planes
+        # Per table: sorted bucket keys and the user codes in that order
+        self.keys = keys
+        self.orders = orders
+        self.probes = probes
+        self.max_candidates = max_candidates
+        self.build_seconds = build_seconds
+
+    @property
+    def n_tables(self):
+        return len(self.keys)
+
+    @property
+    def n_bits(self):
+        return self.planes.shape[1] // self.n_tables
+
+    @property
+    def nbytes(self):
+        """Memory held by the index itself (the interaction matrix is shared)."""
+        return self.planes.nbytes + sum(k.nbytes for k in self.keys) + sum(o.nbytes for o in self.orders)
+
+    def candidates(self, query_row):
+        """User codes hashed together with the query (1 x products sparse row) in any probed bucket."""
+        projections = np.asarray(query_row @ self.planes).reshape(self.n_tables, self.n_bits)
+        keys = _bucket_keys(projections.reshape(1, -1), self.n_tables, self.n_bits)[0]
+
+        found = []
+        for table in range(self.n_tables):
+            probe_keys = [keys[table]]
+            if self.probes:
+                # Flip the bits the query is least certain about
+                closest = np.argsort(np.abs(projections[table]), kind='stable')[:self.probes]
+                probe_keys += [keys[table] ^ (1 << int(bit)) for bit in closest]
+            table_keys, order = self.keys[table], self.orders[table]
+            for key in probe_keys:
+                start, end = np.searchsorted(table_keys, key, 'left'), np.searchsorted(table_keys, key, 'right')
+                found.append(order[start:end])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+
+        codes, counts = np.unique(np.concatenate(found), return_counts=True)
+        if self.max_candidates is not None and len(codes) > self.max_candidates:
+            codes = codes[np.argsort(-counts, kind='stable')[:self.max_candidates]]
+        return codes
+
+    def top_k_similar_users(self, target_user_index, k=None):
+        """
+        Approximate collaborative_based_filtering.top_k_similar_users: (user codes, cosine
+        similarities) of the most similar candidates, best first, exact similarity for each.
+        """
+        query_row = self.interactions.normalized_row(target_user_index)
+        codes = self.candidates(query_row)
+        codes = codes[codes != target_user_index]
+        similarities = (self.interactions.normalized_rows(codes) @ query_row.T).toarray().ravel()
+        best = top_n_indices(similarities, len(codes) if k is None else min(k, len(codes)))
+        return codes[best], similarities[best]
+
+
+def build_user_neighbor_index(interactions, n_tables=DEFAULT_TABLES, n_bits=None, probes=DEFAULT_PROBES,
+                              max_candidates=DEFAULT_MAX_CANDIDATES, seed=0) -> UserNeighborIndex:
+    """
+    Hashes every user into `n_tables` tables of 2**n_bits buckets. n_bits defaults to
+    log2(users / BUCKET_SIZE), i.e. about BUCKET_SIZE users per bucket.
+    """
+    started = time.perf_counter()
+    n_users, n_items = interactions.shape
+    if n_bits is None:
+        n_bits = int(np.clip(round(np.log2(max(n_users, 1) / BUCKET_SIZE)), 1, 24))
+    if not 1 <= n_bits <= 62:
+        raise ValueError("n_bits must be between 1 and 62")
+
+    rng = np.random.default_rng(seed)
+    planes = rng.standard_normal((n_items, n_tables * n_bits)).astype(np.float32)
+    keys = np.empty((n_users, n_tables), dtype=np.int64)
+    normalized = interactions.normalized
+    for start in range(0, n_users, BUILD_BLOCK_SIZE):
+        end = min(start + BUILD_BLOCK_SIZE, n_users)
+        keys[start:end] = _bucket_keys(np.asarray(normalized[start:end] @ planes), n_tables, n_bits)
+
+    orders = [np.argsort(keys[:, table], kind='stable') for table in range(n_tables)]
+    return UserNeighborIndex(interactions, planes,
+                             [keys[order, table] for table, order in enumerate(orders)],
+                             [order.astype(np.int32) for order in orders],
+                             probes, max_candidates, time.perf_counter() - started)
+
+
+def get_user_neighbor_index(data, n_tables=DEFAULT_TABLES, n_bits=None, probes=DEFAULT_PROBES,
+                            max_candidates=DEFAULT_MAX_CANDIDATES) -> UserNeighborIndex:
+    """Returns the user LSH index for the catalog, built once per catalog version and setting."""
+    name = f"user_neighbor_index/{n_tables}/{n_bits}/{probes}/{max_candidates}"
+    return cached_build(name, data, INTERACTION_COLUMNS, lambda d: build_user_neighbor_index(
+        get_interaction_matrix(d), n_tables, n_bits, probes, max_candidates))
+
+
+def neighbor_recall_at_k(index, k=50, sample_size=200, seed=0):
+    """
+    Mean recall@k of index.top_k_similar_users against exact search over a random sample
+    of users, with the mean query latency (ms) of both. Returns (recall, ann_ms, exact_ms).
+    """
+    from collaborative_based_filtering import top_k_similar_users
+
+    interactions = index.interactions
+    rng = np.random.default_rng(seed)
+    users = rng.choice(interactions.shape[0], size=min(sample_size, interactions.shape[0]), replace=False)
+
+    recalls, ann_seconds, exact_seconds = [], 0.0, 0.0
+    for user_code in users:
+        started = time.perf_counter()
+        exact, similarities = top_k_similar_users(interactions, user_code, k)
+        exact_seconds += time.perf_counter() - started
+        # Neighbours with no rated product in common are not neighbours
+        exact = exact[similarities > 0]
+
+        started = time.perf_counter()
+        approximate, _ = index.top_k_similar_users(user_code, k)
+        ann_seconds += time.perf_counter() - started
+
+        if len(exact):
+            recalls.append(len(np.intersect1d(exact, approximate)) / len(exact))
+    n = max(len(users), 1)
+    return float(np.mean(recalls)) if recalls else 1.0, 1000 * ann_seconds / n, 1000 * exact_seconds / n
+
+
+if __name__ == "__main__":
+    from firebase_utils import get_data_from_firebase
+    from preprocess_data import process_data
+
+    raw_data = get_data_from_firebase()
+    if raw_data is None:
+        print("Failed to load data")
+        exit()
+    interactions = get_interaction_matrix(process_data(raw_data))
+    print(f"{interactions.shape[0]} users x {interactions.shape[1]} products")
+
+    for n_tables, n_bits, probes in [(4, None, 0), (8, None, 2), (DEFAULT_TABLES, None, DEFAULT_PROBES), (16, None, 6)]:
+        index = build_user_neighbor_index(interactions, n_tables, n_bits, probes)
+        recall, ann_ms, exact_ms = neighbor_recall_at_k(index)
+        print(f"tables={n_tables} bits={index.n_bits} probes={probes}: built in {index.build_seconds:.2f}s, "
+              f"{index.nbytes / 1e6:.1f} MB, recall@50 {recall:.3f}, {ann_ms:.2f} ms/query (exact {exact_ms:.2f} ms)")
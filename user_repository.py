@@ -0,0 +1,153 @@
+"""
+Per-user access to the /users node.
+
+The app looks users up one at a time (login, session restore, profile, payment), so
+instead of downloading the whole /users tree it reads /users/<user_id> and resolves
+emails through a secondary index kept next to it:
+
+    /user_emails/<encoded lower-cased email> -> user_id
+
+Records read are kept in a small in-process cache for `ttl` seconds; saving a user
+through the repository invalidates its entry. Users written before the index existed are
+indexed all at once: the first lookup that misses builds the index from /users (once per
+database, recorded at /meta/user_emails_indexed), so lookups never depend on how an email
+was capitalized. `python user_repository.py` builds it ahead of time.
+
+`database` is anything with reference(path) like firebase_admin.db, e.g. memory_db.InMemoryDatabase.
+"""
+import copy
+import threading
+import time
+from urllib.parse import quote
+
+USERS_PATH = '/users'
+EMAIL_INDEX_PATH = '/user_emails'
+# Set once the index holds every user saved before it existed
+EMAIL_INDEX_BUILT_PATH = '/meta/user_emails_indexed'
+DEFAULT_TTL = 30
+
+
+def email_key(email):
+    """Index key for an email: lower-cased, with the characters Firebase keys can't hold escaped."""
+    return quote(str(email).strip().lower(), safe='@+-_').replace('.', '%2E')
+
+
+def _as_user_items(node):
+    """Firebase returns /users as a list when the user IDs are dense integers."""
+    if isinstance(node, list):
+        return [(str(uid), user) for uid, user in enumerate(node) if isinstance(user, dict)]
+    if isinstance(node, dict):
+        return [(str(uid), user) for uid, user in node.items() if isinstance(user, dict)]
+    return []
+
+
+class UserRepository:
+    """Reads and writes single user records, with a short-TTL cache."""
+
+    def __init__(self, database, ttl=DEFAULT_TTL):
+        self.database = database
+        self.ttl = ttl
+        # user_id -> (expires at, record or None)
+        self._users = {}
+        self._lock = threading.Lock()
+        self._index_built = False
+
+    def _cached(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                return True, entry[1]
+        return False, None
+
+    def _remember(self, user_id, user):
+        with self._lock:
+            self._users[user_id] = (time.monotonic() + self.ttl, user)
+
+    def invalidate(self, user_id=None):
+        """Drops one user (or everyone) from the cache."""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(str(user_id), None)
+
+    def get(self, user_id):
+        """Returns the user record (a copy, safe to modify) or None."""
+        user_id = str(user_id).strip()
+        if not user_id or any(c in user_id for c in '.#$[]/'):
+            # Not a valid key, so no such user
+            return None
+        hit, user = self._cached(user_id)
+        if not hit:
+            user = self.database.reference(f"{USERS_PATH}/{user_id}").get()
+            user = user if isinstance(user, dict) else None
+            self._remember(user_id, user)
+        return copy.deepcopy(user)
+
+    def exists(self, user_id):
+        return self.get(user_id) is not None
+
+    def find_by_email(self, email):
+        """Returns (user_id, record) of the user with this email (case-insensitive), or (None, None)."""
+        key = email_key(email)
+        found = self._lookup_email(key)
+        if found is None and self._ensure_email_index():
+            found = self._lookup_email(key)
+        return found if found is not None else (None, None)
+
+    def _lookup_email(self, key):
+        user_id = self.database.reference(f"{EMAIL_INDEX_PATH}/{key}").get()
+        if user_id is None:
+            return None
+        user = self.get(user_id)
+        # The index entry may be stale if the email was changed elsewhere
+        if user is None or email_key(user.get('email', '')) != key:
+            return None
+        return str(user_id), user
+
+    def _ensure_email_index(self):
+        """Builds the index if it was never built for this database. True if it was built now."""
+        if self._index_built:
+            return False
+        if self.database.reference(EMAIL_INDEX_BUILT_PATH).get():
+            self._index_built = True
+            return False
+        self.build_email_index()
+        return True
+
+    def save(self, user_data):
+        """Writes the record and its email index entry in one multi-path update."""
+        user_id = str(user_data['user_id'])
+        previous = self.get(user_id)
+        update = {f"{USERS_PATH.strip('/')}/{user_id}": user_data}
+        if user_data.get('email'):
+            update[f"{EMAIL_INDEX_PATH.strip('/')}/{email_key(user_data['email'])}"] = user_id
+        if previous and previous.get('email') and email_key(previous['email']) != email_key(user_data.get('email', '')):
+            update[f"{EMAIL_INDEX_PATH.strip('/')}/{email_key(previous['email'])}"] = None
+        try:
+            self.database.reference('/').update(update)
+        finally:
+            self.invalidate(user_id)
+
+    def build_email_index(self):
+        """Indexes the emails of all existing users (one full read of /users). Returns the count."""
+        update = {}
+        for user_id, user in _as_user_items(self.database.reference(USERS_PATH).get()):
+            if user.get('email'):
+                update[f"{EMAIL_INDEX_PATH.strip('/')}/{email_key(user['email'])}"] = user_id
+        count = len(update)
+        update[EMAIL_INDEX_BUILT_PATH.strip('/')] = True
+        self.database.reference('/').update(update)
+        self._index_built = True
+        return count
+
+
+if __name__ == "__main__":
+    from storage import get_database, is_firebase_backend
+    if is_firebase_backend():
+        import firebase_admin
+        from firebase_admin import credentials
+        firebase_admin.initialize_app(credentials.Certificate('serviceAccountKey.json'), {
+            'databaseURL': 'https://ai-based-recommendation-55bcb-default-rtdb.asia-southeast1.firebasedatabase.app/'
+        })
+    print(f"Indexed {UserRepository(get_database()).build_email_index()} user emails.")
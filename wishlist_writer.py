@@ -0,0 +1,109 @@
+"""
+Write-behind queue for wishlist updates.
+
+Toggling a wishlist item only records the user's new list in memory; a background
+thread writes it every `interval` seconds. Repeated toggles by the same user between
+flushes coalesce into one write of the latest list. Pending lists are flushed at
+interpreter exit, and callers can flush or wait for their write to be acknowledged:
+
+    ticket = writer.enqueue(user_id, items)
+    writer.wait(ticket, timeout=5)   # True once the write (or a newer one) reached the database
+    writer.flush()                   # write everything pending now
+
+`write(user_id, items)` does the actual database write and raises on failure;
+failed writes stay queued and are retried on the next flush.
+"""
+import atexit
+import threading
+
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+
+class WishlistWriter:
+    def __init__(self, write, interval=DEFAULT_FLUSH_INTERVAL):
+        self.write = write
+        self.interval = interval
+        self.last_error = None
+        # user_id -> (sequence number, latest list)
+        self._pending = {}
+        # user_id -> sequence number of the last list written
+        self._acked = {}
+        self._seq = 0
+        self._flush_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        atexit.register(self.close)
+
+    def enqueue(self, user_id, items):
+        """Queues the user's full wishlist (replacing any pending one). Returns a ticket for wait()."""
+        with self._cond:
+            self._seq += 1
+            self._pending[str(user_id)] = (self._seq, list(items))
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name='wishlist-writer', daemon=True)
+                self._thread.start()
+            return str(user_id), self._seq
+
+    def pending(self, user_id):
+        """The queued (not yet written) list for the user, or None."""
+        with self._cond:
+            entry = self._pending.get(str(user_id))
+            return list(entry[1]) if entry is not None else None
+
+    def flush(self, user_id=None):
+        """Writes the pending lists (of one user, or everyone) now. Returns the number written."""
+        with self._flush_lock:
+            with self._cond:
+                if user_id is None:
+                    batch = dict(self._pending)
+                else:
+                    key = str(user_id)
+                    batch = {key: self._pending[key]} if key in self._pending else {}
+
+            written = 0
+            for uid, (seq, items) in batch.items():
+                try:
+                    self.write(uid, items)
+                except Exception as e:
+                    # Stays queued; retried on the next flush
+                    self.last_error = e
+                    print(f"Wishlist write for user {uid} failed: {e}")
+                    continue
+                written += 1
+                with self._cond:
+                    # A newer toggle may have been queued meanwhile; keep that one
+                    if self._pending.get(uid, (None,))[0] == seq:
+                        del self._pending[uid]
+                    self._acked[uid] = max(self._acked.get(uid, 0), seq)
+                    self._cond.notify_all()
+            return written
+
+    def acked(self, ticket):
+        """True once the write of `ticket` (or a newer write for the same user) is in the database."""
+        with self._cond:
+            return self._is_acked(ticket)
+
+    def _is_acked(self, ticket):
+        user_id, seq = ticket
+        return self._acked.get(user_id, 0) >= seq
+
+    def wait(self, ticket, timeout=None):
+        """Blocks until the ticket is acknowledged. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._is_acked(ticket), timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Acknowledgements notify the condition too; only close() ends the wait early
+                if self._cond.wait_for(lambda: self._stopped, self.interval):
+                    return
+            self.flush()
+
+    def close(self):
+        """Stops the background thread and writes whatever is still pending."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self.flush()